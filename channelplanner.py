@@ -0,0 +1,266 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+from stationexception import StationException
+from stationlogger import get_logger
+import threading
+import time, sys
+
+
+class ChannelStats:
+    """
+    Traffic counters of a single RF channel
+
+    @param channel frequency channel
+    @param manager ModemManager object operating on this channel
+    """
+    def reset(self):
+        """
+        Start new accounting window
+        """
+        self.airtime = 0.0
+        self.rx_packets = 0
+        self.tx_packets = 0
+        self.window_start = time.time()
+
+
+    def __init__(self, channel, manager):
+        ## Frequency channel
+        self.channel = channel
+        ## Modem manager
+        self.manager = manager
+        ## Seconds of airtime used in the current window
+        self.airtime = 0.0
+        ## Packets received in the current window
+        self.rx_packets = 0
+        ## Packets transmitted in the current window
+        self.tx_packets = 0
+        ## Start of the current window
+        self.window_start = time.time()
+        ## Utilisation (0-1) measured in the last complete window
+        self.utilisation = 0.0
+
+
+class ChannelPlanner(threading.Thread):
+    """
+    Assign modems to distinct RF channels and balance downlinks among them
+    """
+    # Radio overhead per packet: preamble, sync word, length and CRC (bytes)
+    OVERHEAD_BYTES = 9
+    # Length of the RSSI/LQI header prepended by the modem to every frame
+    HEADER_LENGTH = 6
+    # Length of device addresses in hex characters
+    ADDRESS_LENGTH = 24
+
+
+    def run(self):
+        """
+        Close accounting windows and report utilisation periodically
+        """
+        while True:
+            time.sleep(self.period)
+            self.report()
+
+
+    def assign(self, managers):
+        """
+        Move every modem to its channel from the plan
+
+        @param managers list of ModemManager objects
+        """
+        for index, manager in enumerate(managers):
+            modem = getattr(manager, "modem", None)
+            if modem is None:
+                continue
+            if index >= len(self.channels):
+                raise StationException("Channel plan has " + str(len(self.channels)) + " channels but there are more modems")
+            channel = self.channels[index]
+            if modem.freq_channel != channel:
+                if modem.reconfigure(channel=channel) is None:
+                    raise StationException("Unable to set channel " + str(channel) + " on " + modem.portname)
+            self._logger.info("channel", "Modem assigned to channel " + str(channel), modem.portname)
+            self._stats[manager] = ChannelStats(channel, manager)
+
+
+    def _airtime(self, length):
+        """
+        Estimate airtime of a packet
+
+        @param length length of the packet in hex characters
+
+        @return airtime in seconds
+        """
+        return (length / 2 + ChannelPlanner.OVERHEAD_BYTES) * 8.0 / self.bitrate
+
+
+    def packet_received(self, manager, packet):
+        """
+        Account uplink packet and learn the channel of the sender
+
+        @param manager ModemManager that received the packet
+        @param packet packet received, including the RSSI/LQI header
+        """
+        stats = self._stats.get(manager)
+        if stats is None:
+            return
+        address = packet[ChannelPlanner.HEADER_LENGTH:ChannelPlanner.HEADER_LENGTH + ChannelPlanner.ADDRESS_LENGTH]
+        airtime = self._airtime(len(packet) - ChannelPlanner.HEADER_LENGTH)
+        # Serial threads of every modem and MQTT threads share counters and assignments
+        self._lock.acquire()
+        try:
+            stats.rx_packets += 1
+            stats.airtime += airtime
+            self._assign(address, manager)
+        finally:
+            self._lock.release()
+
+
+    def select(self, packet):
+        """
+        Select the modem in charge of transmitting a downlink packet. Devices
+        already heard are reached through the modem that received them. Other
+        devices are assigned to the least utilised channel
+
+        @param packet downlink packet
+
+        @return ModemManager object
+        """
+        address = packet[:ChannelPlanner.ADDRESS_LENGTH]
+        self._lock.acquire()
+        try:
+            entry = self._devices.get(address)
+            if entry is not None:
+                manager = entry[0]
+            elif len(self._stats) > 0:
+                manager = min(self._stats.values(), key=lambda stats: (stats.utilisation, stats.airtime)).manager
+            else:
+                return None
+            self._assign(address, manager)
+            return manager
+        finally:
+            self._lock.release()
+
+
+    def _assign(self, address, manager):
+        """
+        Record the modem in charge of a device, evicting the least recently
+        seen devices when the table is full. Called with the lock held
+
+        @param address device address
+        @param manager ModemManager object
+        """
+        if address not in self._devices and len(self._devices) >= self.max_devices:
+            # Free 10% of the table at once. Least recently seen devices go first
+            items = sorted((last, dev) for dev, (assigned, last) in self._devices.iteritems())
+            for last, dev in items[:max(1, self.max_devices / 10)]:
+                del self._devices[dev]
+        self._devices[address] = (manager, time.time())
+
+
+    def packet_sent(self, manager, packet):
+        """
+        Account downlink packet
+
+        @param manager ModemManager that transmitted the packet
+        @param packet packet transmitted
+        """
+        stats = self._stats.get(manager)
+        if stats is None:
+            return
+        airtime = self._airtime(len(packet))
+        self._lock.acquire()
+        try:
+            stats.tx_packets += 1
+            stats.airtime += airtime
+        finally:
+            self._lock.release()
+
+
+    def footprint(self):
+        """
+        Get memory taken by the device to modem assignments
+
+        @return dictionary with the amount of devices known and their approximate size in bytes
+        """
+        self._lock.acquire()
+        try:
+            size = sys.getsizeof(self._devices) + sum(sys.getsizeof(address) + sys.getsizeof(entry)
+                                                      for address, entry in self._devices.iteritems())
+            return {"items": len(self._devices), "bytes": size}
+        finally:
+            self._lock.release()
+
+
+    def report(self):
+        """
+        Close current window and publish per-channel utilisation
+        """
+        report = {}
+        self._lock.acquire()
+        try:
+            for stats in self._stats.values():
+                elapsed = time.time() - stats.window_start
+                if elapsed > 0:
+                    stats.utilisation = min(1.0, stats.airtime / elapsed)
+                report[str(stats.channel)] = {"port": stats.manager.modem.portname,
+                                              "utilisation": round(stats.utilisation, 4),
+                                              "rx": stats.rx_packets,
+                                              "tx": stats.tx_packets}
+                stats.reset()
+        finally:
+            self._lock.release()
+
+        for manager in self._stats.keys():
+            manager.mqtt_client.publish_gateway_report("channels", report)
+            break
+
+
+    def __init__(self, channels, bitrate=38400, period=60.0, max_devices=10000):
+        """
+        Class constructor
+
+        @param channels list of frequency channels to be used, one per modem
+        @param bitrate RF bitrate in bps
+        @param period reporting period in seconds
+        @param max_devices maximum amount of device to modem assignments kept
+        """
+        threading.Thread.__init__(self, name="channelplanner")
+        # Configure thread as daemon
+        self.daemon = True
+        ## List of channels
+        self.channels = channels
+        ## RF bitrate
+        self.bitrate = float(bitrate)
+        ## Reporting period
+        self.period = period
+        ## Maximum amount of devices tracked
+        self.max_devices = max_devices
+        # Stats per modem manager
+        self._stats = {}
+        # Modem manager and last time seen per device address
+        self._devices = {}
+        self._lock = threading.Lock()
+        self._logger = get_logger()
@@ -25,8 +25,10 @@ __date__  ="$Apr 22, 2016$"
 #########################################################################
 
 from stationexception import StationException
+from stationlogger import LogLevel
+from gwap import GwapPacket
 import json
-import re, uuid
+import re, os
 
 
 class SerialConfig:
@@ -39,12 +41,303 @@ class SerialConfig:
     def __init__(self, name, speed):
         self.name = name
         self.speed = speed
+
+
+class LogConfig:
+    """
+    Logging settings
+    
+    @param config "log" section from the configuration file
+    """
+    ## Log level names
+    LEVELS = {"debug": LogLevel.DEBUG, "info": LogLevel.INFO, "warning": LogLevel.WARNING, "error": LogLevel.ERROR}
+
+    def __init__(self, config):
+        ## Print out GWAP traffic
+        self.verbose = config.get("verbose", True)
+        ## Minimum level to be logged
+        self.level = LogConfig.LEVELS.get(str(config.get("level", "debug")).lower(), LogLevel.DEBUG)
+        ## Log file. Standard output if None
+        self.filename = config.get("file")
+        ## Sampling and rate limits per category. Example: {"rx": {"sample": 10, "rate": 50}}
+        self.filters = config.get("filters", {})
+
+
+class ChannelPlanConfig:
+    """
+    RF channel plan
+    
+    @param config "channelplan" section from the configuration file
+    """
+    def __init__(self, config):
+        ## Frequency channels, one per modem in the same order as the serial ports
+        self.channels = config["channels"]
+        ## RF bitrate in bps
+        self.bitrate = config.get("bitrate", 38400)
+        ## Utilisation reporting period in seconds
+        self.period = config.get("period", 60)
+        ## Maximum amount of devices whose modem is remembered
+        self.max_devices = config.get("maxdevices", 10000)
+
+
+class ProfilingConfig:
+    """
+    On-demand profiling settings
+    
+    @param config "profiling" section from the configuration file
+    """
+    def __init__(self, config):
+        ## Directory where profiles are written
+        self.directory = config.get("directory", "/tmp")
+        ## Default profiling period in seconds
+        self.duration = config.get("duration", 30)
+        ## Sampling interval in seconds
+        self.interval = config.get("interval", 0.01)
+        ## Maximum profiling period in seconds
+        self.max_duration = config.get("maxduration", 300)
+
+
+class MemoryConfig:
+    """
+    Memory accounting settings
+    
+    @param config "memory" section from the configuration file
+    """
+    def __init__(self, config):
+        ## Reporting period in seconds. Reports are only taken on demand if 0
+        self.period = config.get("period", 0)
+        ## Amount of object types and source lines reported
+        self.top = config.get("top", 10)
+        ## Maximum resident set size in kB. None for no budget
+        self.rss_budget = config.get("rssbudget")
+        ## Frames stored per allocation by tracemalloc, where available. Disabled if 0
+        self.trace_frames = config.get("traceframes", 0)
+
+
+class WatchdogConfig:
+    """
+    Watchdog settings and latency thresholds. All values in seconds
+    
+    @param config "watchdog" section from the configuration file
+    """
+    def __init__(self, config):
+        ## Period between checks
+        self.period = config.get("period", 5)
+        ## Period between heart beats
+        self.heartbeat = config.get("heartbeat", 60)
+        ## Serial loop without progress before being considered stalled
+        self.loopstall = config.get("loopstall", 5)
+        ## Maximum age of a packet waiting in the transmission queue
+        self.txqueueage = config.get("txqueueage", 2)
+        ## Maximum period without serial packets
+        self.rxsilence = config.get("rxsilence", 3600)
+        ## Pending MQTT messages without progress before being considered stalled
+        self.publishstall = config.get("publishstall", 30)
+        ## Try to recover from stalls
+        self.selfheal = config.get("selfheal", False)
+
+
+class RateLimitConfig:
+    """
+    Per-device rate limits
+    
+    @param config "ratelimit" section from the configuration file
+    """
+    def __init__(self, config):
+        ## Sustained amount of frames per second allowed per device
+        self.rate = config.get("rate", 1.0)
+        ## Maximum amount of frames allowed in a burst
+        self.burst = config.get("burst", 10)
+        ## Frames dropped within a heart beat period before quarantining the device
+        self.quarantine = config.get("quarantine", 100)
+        ## Quarantine period in seconds
+        self.quarantine_time = config.get("quarantinetime", 600)
+        ## Maximum amount of devices tracked
+        self.max_devices = config.get("maxdevices", 50000)
+
+
+class PriorityConfig:
+    """
+    Priority lanes ("high", "normal" or "low") for uplink and downlink traffic
+    
+    @param config "priority" section from the configuration file
+    """
+    def __init__(self, config):
+        ## Lane per device address
+        self.addresses = config.get("addresses", {})
+        ## Lane per GWAP function (status, query, command)
+        self.functions = config.get("functions", {})
+        ## Lane per control subtopic
+        self.subtopics = config.get("control", {})
+        ## Maximum time in seconds low priority packets can be overtaken
+        self.max_wait = config.get("maxwait", 1.0)
+
+
+class DownlinkConfig:
+    """
+    Downlink acknowledgment tracking and retries
+    
+    @param config "downlink" section from the configuration file
+    """
+    def __init__(self, config):
+        ## Time to wait for a response before the first retry, in seconds
+        self.timeout = config.get("timeout", 0.5)
+        ## Multiplier applied to the timeout after every retry
+        self.backoff = config.get("backoff", 2.0)
+        ## Time after which a downlink is considered failed, in seconds
+        self.deadline = config.get("deadline", 5.0)
+        ## GWAP functions tracked
+        self.functions = [GwapPacket.Function.names[name] for name in config.get("functions", ["query", "command"])]
+
+
+class CoalesceConfig:
+    """
+    Downlinks replacing older ones still waiting for transmission
+    
+    @param config "coalesce" section from the configuration file
+    """
+    def __init__(self, config):
+        ## Control subtopics whose downlinks replace pending downlinks for the same device and register
+        self.subtopics = config.get("control", [])
+
+
+class CompressionConfig:
+    """
+    Compressed uplink batches
+    
+    @param config "compression" section from the configuration file
+    """
+    def __init__(self, config):
+        ## Maximum amount of network messages per batch
+        self.batch_size = config.get("batch", 20)
+        ## Maximum time a message waits for its batch to be completed, in seconds
+        self.max_delay = config.get("maxdelay", 1.0)
+        ## Preset dictionary file. None to compress without dictionary
+        self.dictionary = config.get("dictionary")
+        ## Compression level (1-9)
+        self.level = config.get("level", 9)
+
+
+class LinkQualityConfig:
+    """
+    Link quality analytics
+    
+    @param config "linkquality" section from the configuration file
+    """
+    def __init__(self, config):
+        ## Amount of frames kept per device
+        self.window = config.get("window", 32)
+        ## Maximum amount of devices tracked
+        self.max_devices = config.get("maxdevices", 10000)
+        ## Amount of devices with the worst RSSI reported individually
+        self.worst = config.get("worst", 5)
+
+
+class ValidationConfig:
+    """
+    Validation of frames received from the modems
+    
+    @param config "validation" section from the configuration file
+    """
+    def __init__(self, config):
+        ## Validate frames
+        self.enabled = config.get("enabled", True)
+        ## Minimum frame length in characters. Shortest GWAP packet if None
+        self.min_length = config.get("minlength")
+        ## Maximum frame length in characters
+        self.max_length = config.get("maxlength", 256)
+        ## Amount of rejected frames reported per heart beat
+        self.samples = config.get("samples", 10)
+        ## File where rejected frames are appended
+        self.capture_file = config.get("capture")
+
+
+class ShutdownConfig:
+    """
+    Shutdown settings
+    
+    @param config "shutdown" section from the configuration file
+    """
+    def __init__(self, config):
+        ## Maximum time to drain transmission and publication queues, in seconds
+        self.deadline = config.get("deadline", 5.0)
+        ## File where uplinks not published before the deadline are kept. None to drop them
+        self.spool = config.get("spool")
+        
+    
+class StartupConfig:
+    """
+    Startup settings
+    
+    @param config "startup" section from the configuration file
+    """
+    def __init__(self, config):
+        ## Log duration of every startup phase
+        self.instrument = config.get("instrument", False)
+        ## Maximum time from process start to first frame forwarded, in seconds. None for no budget
+        self.budget = config.get("budget")
+        ## File where the gateway key is cached. None to resolve it on every start
+        self.key_cache = config.get("keycache")
         
     
 class Config:
     """
     Config Class
     """
+    def _hardware_addresses(self):
+        """
+        Get hardware addresses of the network interfaces (Linux only)
+        
+        @return set of addresses in gateway key format. Empty if not available
+        """
+        addresses = set()
+        try:
+            for interface in os.listdir("/sys/class/net"):
+                try:
+                    address_file = open(os.path.join("/sys/class/net", interface, "address"))
+                    addresses.add(address_file.read().strip().replace(":", "").upper())
+                    address_file.close()
+                except IOError:
+                    pass
+        except OSError:
+            pass
+        return addresses
+
+
+    def _gateway_key(self, key_cache):
+        """
+        Get gateway key from the cache file or, on a cache miss, from the MAC address.
+        Resolving the MAC address can be slow since it may run external commands.
+        Cached keys are only used while their MAC address belongs to one of the
+        network interfaces, so a board swap or a moved SD card gets a new key
+        
+        @param key_cache path to the cache file. None to disable caching
+        
+        @return gateway key
+        """
+        if key_cache is not None and os.path.exists(key_cache):
+            try:
+                cache_file = open(key_cache)
+                gateway_key = cache_file.read().strip()
+                cache_file.close()
+                if re.match("[0-9A-F]{12}$", gateway_key) is not None and gateway_key in self._hardware_addresses():
+                    return gateway_key
+            except IOError:
+                pass
+
+        # Only imported on a cache miss
+        import uuid
+        gateway_key = ''.join(re.findall('..', '%012X' % uuid.getnode()))
+        if key_cache is not None:
+            try:
+                cache_file = open(key_cache, "w")
+                cache_file.write(gateway_key + "\n")
+                cache_file.close()
+            except IOError:
+                pass
+        return gateway_key
+
+
     def __init__(self, filename):
         """
         Class constructor
@@ -59,8 +352,54 @@ class Config:
         self.mqtt_port = None
         self.mqtt_topic = None
         self.user_key = None
+        self.mqtt_version = 3
+        self.mqtt_session_expiry = 0
+        self.mqtt_qos = 0
+        self.mqtt_sequence = False
         self.coordinates = None
         
+        ## Logging settings
+        self.log = None
+        
+        ## RF channel plan. None if modems are left on their current channel
+        self.channel_plan = None
+        
+        ## Profiling settings
+        self.profiling = None
+        
+        ## Memory accounting settings
+        self.memory = None
+        
+        ## Watchdog settings
+        self.watchdog = None
+        
+        ## Per-device rate limits. None if disabled
+        self.rate_limit = None
+        
+        ## Priority lanes. None if disabled
+        self.priority = None
+        
+        ## Downlink tracking. None if disabled
+        self.downlink = None
+        
+        ## Downlink coalescing. None if disabled
+        self.coalesce = None
+        
+        ## Uplink compression. None if disabled
+        self.compression = None
+        
+        ## Link quality analytics. None if disabled
+        self.link_quality = None
+        
+        ## Frame validation
+        self.validation = None
+        
+        ## Shutdown settings
+        self.shutdown = None
+        
+        ## Startup settings
+        self.startup = None
+        
         ## Config file
         try:
             config_file = open(filename)
@@ -68,19 +407,79 @@ class Config:
             config_serial = config["serial"]
             config_mqtt = config["mqtt"]
             config_coord = config["coord"]
+            config_log = config.get("log", {})
             config_file.close()
             
             self.mqtt_server = config_mqtt["mqttserver"]
             self.mqtt_port = config_mqtt["mqttport"]
             self.mqtt_topic = config_mqtt["mqttmaintopic"]
             self.user_key = config_mqtt["userkey"]
+            self.mqtt_version = config_mqtt.get("mqttversion", 3)
+            self.mqtt_session_expiry = config_mqtt.get("sessionexpiry", 0)
+            self.mqtt_qos = config_mqtt.get("qos", 0)
+            self.mqtt_sequence = config_mqtt.get("sequence", False)
                         
-            # Take gateway ID from MAC address
-            self.gateway_key = ''.join(re.findall('..', '%012X' % uuid.getnode())) 
+            # Startup
+            self.startup = StartupConfig(config.get("startup", {}))
+            
+            # Take gateway ID from the configuration file, the key cache or the MAC address
+            if "gatewaykey" in config_mqtt:
+                self.gateway_key = str(config_mqtt["gatewaykey"])
+            else:
+                key_cache = self.startup.key_cache
+                if key_cache is not None:
+                    key_cache = os.path.join(os.path.dirname(filename), key_cache)
+                self.gateway_key = self._gateway_key(key_cache)
 
             # Coordinates
             self.coordinates = (config_coord["latitude"], config_coord["longitude"]);
 
+            # Logging
+            self.log = LogConfig(config_log)
+
+            # Channel plan
+            if "channelplan" in config:
+                self.channel_plan = ChannelPlanConfig(config["channelplan"])
+
+            # Profiling
+            self.profiling = ProfilingConfig(config.get("profiling", {}))
+
+            # Memory accounting
+            self.memory = MemoryConfig(config.get("memory", {}))
+
+            # Watchdog
+            self.watchdog = WatchdogConfig(config.get("watchdog", {}))
+
+            # Rate limits
+            if "ratelimit" in config:
+                self.rate_limit = RateLimitConfig(config["ratelimit"])
+
+            # Priority lanes
+            if "priority" in config:
+                self.priority = PriorityConfig(config["priority"])
+
+            # Downlink tracking
+            if "downlink" in config:
+                self.downlink = DownlinkConfig(config["downlink"])
+
+            # Downlink coalescing
+            if "coalesce" in config:
+                self.coalesce = CoalesceConfig(config["coalesce"])
+
+            # Uplink compression
+            if "compression" in config:
+                self.compression = CompressionConfig(config["compression"])
+
+            # Link quality analytics
+            if "linkquality" in config:
+                self.link_quality = LinkQualityConfig(config["linkquality"])
+
+            # Frame validation
+            self.validation = ValidationConfig(config.get("validation", {}))
+
+            # Shutdown
+            self.shutdown = ShutdownConfig(config.get("shutdown", {}))
+
             # for each serial port
             for port in config_serial:
                 if "port" in port and "speed" in port:
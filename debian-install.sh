@@ -23,7 +23,8 @@ echo ""
 echo "------------------------------------"
 echo " INSTALL PAHO-MQTT"
 echo "------------------------------------"
-easy_install paho-mqtt
+# 1.5 or later for MQTT 5 properties. 2.0 changed the callback API
+easy_install "paho-mqtt>=1.5,<2.0"
 
 echo ""
 echo "------------------------------------"
@@ -0,0 +1,192 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+"""
+Train, rotate and benchmark preset dictionaries for compressed uplink batches
+
+  python dictionarytool.py train station.log [...] -o uplink.dict
+  python dictionarytool.py rotate uplink.dict dictionaries
+  python dictionarytool.py bench station.log [...] -d dictionaries/current.dict
+
+Frames are taken from any text file containing them, such as station logs
+with rx traffic or plain lists of frames
+"""
+
+from uplinkcompressor import UplinkCompressor
+from stationexception import StationException
+import argparse
+import shutil
+import time
+import os
+import re
+
+
+## Frame with RSSI/LQI header
+FRAME = re.compile(r"\([0-9A-F]{4}\)[0-9A-F]+")
+## Name of the dictionary in use within the dictionaries directory
+CURRENT = "current.dict"
+
+
+def read_frames(filenames):
+    """
+    Extract frames from text files
+
+    @param filenames list of files
+
+    @return list of frames
+    """
+    frames = []
+    for filename in filenames:
+        text_file = open(filename)
+        for line in text_file:
+            frames.extend(FRAME.findall(line))
+        text_file.close()
+    return frames
+
+
+def train(frames, size, segment):
+    """
+    Build dictionary from the most frequent segments of the frames. Segments
+    start at byte boundaries. The most frequent segments are placed at the end
+    of the dictionary, where back-references are shortest
+
+    @param frames list of frames
+    @param size maximum dictionary size in bytes
+    @param segment segment length in characters
+
+    @return dictionary contents
+    """
+    counts = {}
+    for frame in frames:
+        for start in range(0, len(frame) - segment + 1, 2):
+            key = frame[start:start + segment]
+            counts[key] = counts.get(key, 0) + 1
+
+    selected = []
+    length = 0
+    for key, count in sorted(counts.items(), key=lambda item: item[1], reverse=True):
+        if count < 2 or length + len(key) > size:
+            break
+        if any(key in other for other in selected):
+            continue
+        selected.append(key)
+        length += len(key)
+    selected.reverse()
+    return "".join(selected)
+
+
+def rotate(filename, directory):
+    """
+    Install a new dictionary. The dictionary is archived under its identifier,
+    so that batches compressed with older dictionaries can still be decoded,
+    and replaces the current one. Stations pick it up on restart
+
+    @param filename new dictionary
+    @param directory dictionaries directory
+
+    @return dictionary identifier
+    """
+    dictionary = UplinkCompressor.load(filename)
+    dictionary_id = UplinkCompressor.dictionary_id(dictionary)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    archived = os.path.join(directory, "%08X.dict" % dictionary_id)
+    shutil.copyfile(filename, archived)
+    # Atomic replacement of the current dictionary
+    temporary = os.path.join(directory, CURRENT + ".tmp")
+    shutil.copyfile(filename, temporary)
+    os.rename(temporary, os.path.join(directory, CURRENT))
+    return dictionary_id
+
+
+def bench(frames, dictionary, batch_sizes, level):
+    """
+    Print compression ratio and CPU time per batch, with and without dictionary
+
+    @param frames list of frames
+    @param dictionary dictionary contents. None to only test without dictionary
+    @param batch_sizes list of batch sizes
+    @param level compression level
+    """
+    candidates = [("none", UplinkCompressor(None, level))]
+    if dictionary is not None:
+        candidates.append(("%08X" % UplinkCompressor.dictionary_id(dictionary), UplinkCompressor(dictionary, level)))
+
+    print "%-10s %6s %10s %10s %8s %12s" % ("dictionary", "batch", "raw", "compressed", "ratio", "us/batch")
+    for name, compressor in candidates:
+        for batch_size in batch_sizes:
+            batches = [frames[start:start + batch_size] for start in range(0, len(frames), batch_size)]
+            raw = sum(len("\n".join(batch)) for batch in batches)
+            start = time.clock()
+            compressed = sum(len(compressor.compress(batch)) for batch in batches)
+            elapsed = time.clock() - start
+            print "%-10s %6d %10d %10d %8.2f %12.1f" % (name, batch_size, raw, compressed, float(raw) / compressed,
+                                                         elapsed * 1e6 / len(batches))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Preset dictionaries for compressed uplink batches")
+    commands = parser.add_subparsers(dest="command")
+
+    train_parser = commands.add_parser("train", help="train dictionary from captured frames")
+    train_parser.add_argument("files", nargs="+", help="files containing frames")
+    train_parser.add_argument("-o", "--output", required=True, help="dictionary file")
+    train_parser.add_argument("-s", "--size", type=int, default=4096, help="maximum dictionary size in bytes")
+    train_parser.add_argument("-l", "--segment", type=int, default=24, help="segment length in characters")
+
+    rotate_parser = commands.add_parser("rotate", help="install dictionary as the current one")
+    rotate_parser.add_argument("dictionary", help="dictionary file")
+    rotate_parser.add_argument("directory", help="dictionaries directory")
+
+    bench_parser = commands.add_parser("bench", help="measure compression ratio and CPU cost per batch size")
+    bench_parser.add_argument("files", nargs="+", help="files containing frames")
+    bench_parser.add_argument("-d", "--dictionary", help="dictionary file")
+    bench_parser.add_argument("-b", "--batch", type=int, nargs="+", default=[1, 5, 10, 20, 50], help="batch sizes")
+    bench_parser.add_argument("--level", type=int, default=9, help="compression level")
+
+    args = parser.parse_args()
+    try:
+        if args.command == "train":
+            frames = read_frames(args.files)
+            dictionary = train(frames, min(args.size, UplinkCompressor.MAX_DICTIONARY), args.segment)
+            output = open(args.output, "wb")
+            output.write(dictionary)
+            output.close()
+            print "Dictionary %08X of %d bytes trained from %d frames" % (UplinkCompressor.dictionary_id(dictionary),
+                                                                         len(dictionary), len(frames))
+        elif args.command == "rotate":
+            print "Dictionary %08X installed" % rotate(args.dictionary, args.directory)
+        elif args.command == "bench":
+            frames = read_frames(args.files)
+            dictionary = None
+            if args.dictionary is not None:
+                dictionary = UplinkCompressor.load(args.dictionary)
+            bench(frames, dictionary, args.batch, args.level)
+    except StationException as ex:
+        ex.show()
+    except (IOError, OSError) as ex:
+        print str(ex)
@@ -0,0 +1,219 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+from gwap import GwapPacket
+from stationlogger import get_logger
+import threading
+import time, sys
+
+
+class PendingDownlink:
+    """
+    Downlink packet waiting for a response from its device
+
+    @param packet downlink packet
+    @param lane priority lane
+    @param key coalescing key in the transmission queue
+    @param timeout time to wait before the first retry
+    @param deadline time after which the downlink is considered failed
+    """
+    def __init__(self, packet, lane, key, timeout, deadline):
+        now = time.time()
+        ## Downlink packet
+        self.packet = packet
+        ## Priority lane
+        self.lane = lane
+        ## Coalescing key
+        self.key = key
+        ## Time of the first transmission
+        self.first_sent = now
+        ## Amount of transmissions
+        self.attempts = 1
+        ## Current retry timeout
+        self.timeout = timeout
+        ## Time of the next retry
+        self.next_retry = now + timeout
+        ## Time after which the downlink is considered failed
+        self.deadline = now + deadline
+
+
+class DownlinkTracker(threading.Thread):
+    """
+    Track downlinks until their devices respond with a status packet for the
+    same register. Downlinks are retried locally with exponential backoff
+    until the response is received or the deadline expires
+    """
+    def run(self):
+        """
+        Retry and expire pending downlinks
+        """
+        while self._go_on:
+            time.sleep(self.period)
+            now = time.time()
+            expired = []
+            retries = []
+            self._lock.acquire()
+            try:
+                for key, pending in self._pending.items():
+                    if now >= pending.deadline:
+                        del self._pending[key]
+                        expired.append((key, pending))
+                    elif now >= pending.next_retry:
+                        pending.attempts += 1
+                        pending.timeout *= self.backoff
+                        pending.next_retry = now + pending.timeout
+                        retries.append(pending)
+            finally:
+                self._lock.release()
+
+            for pending in retries:
+                self.send(pending.packet, pending.lane, pending.key)
+            for key, pending in expired:
+                self._notify(key, pending, "FAILED")
+
+
+    def stop(self):
+        """
+        Stop retrying pending downlinks
+        """
+        self._go_on = False
+
+
+    def sent(self, packet, lane, key=None):
+        """
+        Transmit downlink packet and track it if its function requires a response
+
+        @param packet downlink packet
+        @param lane priority lane
+        @param key coalescing key in the transmission queue. Also used for retries
+        """
+        self.send(packet, lane, key)
+        try:
+            gwap = GwapPacket(packet)
+        except ValueError:
+            return
+        if gwap.function not in self.functions:
+            return
+
+        self._lock.acquire()
+        try:
+            # Newer downlinks for the same register replace older ones
+            self._pending[(gwap.address, gwap.regid)] = PendingDownlink(packet, lane, key, self.timeout, self.deadline)
+        finally:
+            self._lock.release()
+
+
+    def packet_received(self, packet):
+        """
+        Check whether an uplink packet answers a pending downlink
+
+        @param packet packet received, including the RSSI/LQI header
+        """
+        if len(self._pending) == 0:
+            return
+        try:
+            gwap = GwapPacket(packet, header=True)
+        except ValueError:
+            return
+        if gwap.function != GwapPacket.Function.STATUS:
+            return
+
+        key = (gwap.address, gwap.regid)
+        self._lock.acquire()
+        try:
+            pending = self._pending.pop(key, None)
+        finally:
+            self._lock.release()
+        if pending is not None:
+            self._notify(key, pending, "DELIVERED")
+
+
+    def footprint(self):
+        """
+        Get memory taken by the pending downlinks
+
+        @return dictionary with the amount of pending downlinks and their approximate size in bytes
+        """
+        self._lock.acquire()
+        try:
+            size = sys.getsizeof(self._pending)
+            for pending in self._pending.values():
+                size += sys.getsizeof(pending) + sys.getsizeof(pending.__dict__) + sys.getsizeof(pending.packet)
+            return {"items": len(self._pending), "bytes": size}
+        finally:
+            self._lock.release()
+
+
+    def _notify(self, key, pending, status):
+        """
+        Report final status of a downlink
+
+        @param key (device address, register id)
+        @param pending PendingDownlink object
+        @param status DELIVERED or FAILED
+        """
+        latency = time.time() - pending.first_sent
+        self._logger.info("downlink", key[0] + " register " + str(key[1]) + " " + status +
+                          " after " + str(pending.attempts) + " attempts (" + str(int(latency * 1000)) + " ms)")
+        if self.publish is not None:
+            self.publish({"address": key[0], "register": key[1], "status": status,
+                          "attempts": pending.attempts, "latency": round(latency, 3)})
+
+
+    def __init__(self, send, publish, timeout=0.5, backoff=2.0, deadline=5.0, functions=None, period=0.05):
+        """
+        Class constructor
+
+        @param send packet transmission function. Takes packet, priority lane and coalescing key as arguments
+        @param publish function reporting the final status of every tracked downlink
+        @param timeout time to wait for a response before the first retry, in seconds
+        @param backoff multiplier applied to the timeout after every retry
+        @param deadline time after which a downlink is considered failed, in seconds
+        @param functions list of GWAP function codes to be tracked. Queries and commands by default
+        @param period period between checks of pending downlinks, in seconds
+        """
+        threading.Thread.__init__(self, name="downlinks")
+        # Configure thread as daemon
+        self.daemon = True
+        ## Transmission function
+        self.send = send
+        ## Status report function
+        self.publish = publish
+        ## Retry settings
+        self.timeout = timeout
+        self.backoff = backoff
+        self.deadline = deadline
+        ## Functions tracked
+        self.functions = functions
+        if functions is None:
+            self.functions = [GwapPacket.Function.QUERY, GwapPacket.Function.COMMAND]
+        ## Period between checks
+        self.period = period
+        # Pending downlinks per (address, register id)
+        self._pending = {}
+        self._go_on = True
+        self._lock = threading.Lock()
+        self._logger = get_logger()
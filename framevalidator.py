@@ -0,0 +1,149 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+from gwap import GwapPacket
+from stationlogger import get_logger
+import collections
+import threading
+import re
+
+
+class FrameValidator:
+    """
+    Validate frames received from the modem before they reach the rest of
+    the station. Valid frames are accepted with a single precompiled regular
+    expression. The rejection reason is only worked out for invalid frames
+    """
+    ## Header followed by address, nonce, function and register id, plus whole bytes of value
+    FRAME = re.compile(r"\([0-9A-F]{4}\)[0-9A-F]{%d}(?:[0-9A-F]{2})*$" % GwapPacket.VALUE_OFFSET)
+    ## RSSI/LQI header
+    HEADER = re.compile(r"\([0-9A-F]{4}\)")
+    ## Hex digits
+    HEX = re.compile(r"[0-9A-F]*$")
+
+
+    def validate(self, frame):
+        """
+        Check frame
+
+        @param frame frame received from the modem
+
+        @return True if the frame is valid
+        """
+        if self.min_length <= len(frame) <= self.max_length and self._match(frame) is not None:
+            return True
+        reason = self._reason(frame)
+        # Counters are swapped by report() from the heart beat thread
+        self._lock.acquire()
+        try:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+            self.total_rejected += 1
+        finally:
+            self._lock.release()
+        if self.samples > 0:
+            self._captured.append(reason + " " + repr(frame))
+        return False
+
+
+    def _reason(self, frame):
+        """
+        Work out why a frame was rejected
+
+        @param frame rejected frame
+
+        @return rejection reason
+        """
+        if len(frame) < self.min_length:
+            return "short"
+        if len(frame) > self.max_length:
+            return "long"
+        if FrameValidator.HEADER.match(frame) is None:
+            return "header"
+        if FrameValidator.HEX.match(frame, GwapPacket.HEADER_LENGTH) is None:
+            return "charset"
+        return "length"
+
+
+    def report(self):
+        """
+        Get rejection counters and captured frames, and start a new reporting period.
+        Captured frames are also appended to the capture file, if any
+
+        @return dictionary with the amount of frames rejected per reason and the last
+        frames rejected. None if no frame was rejected
+        """
+        self._lock.acquire()
+        try:
+            if len(self.rejected) == 0:
+                return None
+            rejected = self.rejected
+            self.rejected = {}
+        finally:
+            self._lock.release()
+        samples = []
+        try:
+            while True:
+                samples.append(self._captured.popleft())
+        except IndexError:
+            pass
+
+        if self.capture_file is not None and len(samples) > 0:
+            try:
+                capture = open(self.capture_file, "a")
+                capture.write("\n".join(samples) + "\n")
+                capture.close()
+            except IOError as ex:
+                self._logger.error("validation", "Unable to write " + self.capture_file + ": " + str(ex))
+
+        return {"rejected": rejected, "samples": samples}
+
+
+    def __init__(self, min_length=None, max_length=256, samples=10, capture_file=None):
+        """
+        Class constructor
+
+        @param min_length minimum frame length in characters. Header, address, nonce,
+        function and register id by default
+        @param max_length maximum frame length in characters
+        @param samples amount of rejected frames kept per reporting period
+        @param capture_file file where rejected frames are appended. None to disable
+        """
+        ## Length limits
+        self.min_length = min_length or GwapPacket.HEADER_LENGTH + GwapPacket.VALUE_OFFSET
+        self.max_length = max_length
+        ## Rejected frames per reason in the current reporting period
+        self.rejected = {}
+        ## Rejected frames since start
+        self.total_rejected = 0
+        ## Amount of rejected frames kept
+        self.samples = samples
+        ## Capture file
+        self.capture_file = capture_file
+        # Last rejected frames
+        self._captured = collections.deque(maxlen=max(1, samples))
+        self._match = FrameValidator.FRAME.match
+        self._lock = threading.Lock()
+        self._logger = get_logger()
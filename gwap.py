@@ -0,0 +1,80 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+
+class GwapPacket:
+    """
+    Fields of a GWAP packet in hex text format. Frames received from the modem
+    are preceded by a (RRLL) header carrying RSSI and LQI. Downlink packets
+    have no header
+    """
+    class Function:
+        """
+        GWAP function codes
+        """
+        STATUS = 0
+        QUERY = 1
+        COMMAND = 2
+
+        names = {"status": STATUS, "query": QUERY, "command": COMMAND}
+
+    ## Length of the RSSI/LQI header
+    HEADER_LENGTH = 6
+    ## Length of device addresses (hex characters)
+    ADDRESS_LENGTH = 24
+    ## Offsets of the fields following the address
+    NONCE_OFFSET = ADDRESS_LENGTH
+    FUNCTION_OFFSET = ADDRESS_LENGTH + 2
+    REGID_OFFSET = ADDRESS_LENGTH + 4
+    VALUE_OFFSET = ADDRESS_LENGTH + 6
+
+
+    def __init__(self, packet, header=False):
+        """
+        Class constructor
+
+        @param packet packet in hex text format
+        @param header True if the packet is preceded by the RSSI/LQI header
+        """
+        ## RSSI and LQI raw values. None for downlink packets
+        self.rssi = None
+        self.lqi = None
+        offset = 0
+        if header:
+            self.rssi = int(packet[1:3], 16)
+            self.lqi = int(packet[3:5], 16)
+            offset = GwapPacket.HEADER_LENGTH
+
+        ## Device address
+        self.address = packet[offset:offset + GwapPacket.ADDRESS_LENGTH]
+        ## Transaction nonce
+        self.nonce = int(packet[offset + GwapPacket.NONCE_OFFSET:offset + GwapPacket.FUNCTION_OFFSET], 16)
+        ## Function code
+        self.function = int(packet[offset + GwapPacket.FUNCTION_OFFSET:offset + GwapPacket.REGID_OFFSET], 16)
+        ## Register id
+        self.regid = int(packet[offset + GwapPacket.REGID_OFFSET:offset + GwapPacket.VALUE_OFFSET], 16)
+        ## Register value in hex format
+        self.value = packet[offset + GwapPacket.VALUE_OFFSET:]
@@ -0,0 +1,417 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+from gwap import GwapPacket
+import threading
+import collections
+import sys
+import time
+
+
+class Lane:
+    """
+    Priority lanes, from highest to lowest priority
+    """
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+    names = {"high": HIGH, "normal": NORMAL, "low": LOW}
+    labels = {HIGH: "high", NORMAL: "normal", LOW: "low"}
+
+
+class LaneQueue:
+    """
+    Thread-safe multi-level queue. Items are served from the highest priority
+    lane, except when the oldest item of a lower lane has waited longer than
+    max_wait, which prevents low priority traffic from starving. Keyed items
+    replace the item still queued with the same key, keeping its position
+    """
+    def put(self, item, lane=Lane.NORMAL, key=None):
+        """
+        Queue item
+
+        @param item item to be queued
+        @param lane priority lane
+        @param key coalescing key. None if the item never replaces others
+        """
+        self._cond.acquire()
+        try:
+            if key is not None:
+                entry = self._keyed.get(key)
+                if entry is not None:
+                    # Last write wins
+                    entry[1] = item
+                    self.coalesced += 1
+                    return
+            if self.maxsize is not None and self._size() >= self.maxsize:
+                # Discard oldest item from the lowest priority lane in use
+                for entries in reversed(self._lanes):
+                    if len(entries) > 0:
+                        self._forget(entries.popleft())
+                        self.dropped += 1
+                        break
+            entry = [time.time(), item, key]
+            self._lanes[lane].append(entry)
+            if key is not None:
+                self._keyed[key] = entry
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+
+    def get(self, timeout=None):
+        """
+        Take next item from the queue
+
+        @param timeout maximum time to wait for an item in seconds. Wait forever if None. Do not
+        wait if 0
+
+        @return item or None if the queue is still empty after the timeout
+        """
+        return self.get_lane(timeout)[0]
+
+
+    def get_lane(self, timeout=None):
+        """
+        Take next item from the queue along with its lane
+
+        @param timeout maximum time to wait for an item in seconds. Wait forever if None. Do not
+        wait if 0
+
+        @return tuple (item, lane). (None, None) if the queue is still empty after the timeout
+        """
+        self._cond.acquire()
+        try:
+            if timeout != 0:
+                end = None if timeout is None else time.time() + timeout
+                while self._size() == 0:
+                    if end is None:
+                        self._cond.wait()
+                    else:
+                        remaining = end - time.time()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+
+            now = time.time()
+            selected = None
+            starving = False
+            for lane, entries in enumerate(self._lanes):
+                if len(entries) == 0:
+                    continue
+                if selected is None:
+                    selected = lane
+                elif self._served_starving:
+                    # Higher lanes always get every other turn
+                    break
+                elif now - entries[0][0] > self.max_wait and entries[0][0] < self._lanes[selected][0][0]:
+                    # Starving item from a lower lane
+                    selected = lane
+                    starving = True
+            if selected is None:
+                return None, None
+            self._served_starving = starving
+
+            entry = self._lanes[selected].popleft()
+            self._forget(entry)
+            self._account(selected, now - entry[0])
+            return entry[1], selected
+        finally:
+            self._cond.release()
+
+
+    def get_batch(self, lane, count, timeout):
+        """
+        Take items from a single lane, oldest first. Stops early as soon as a
+        higher priority lane has items waiting
+
+        @param lane priority lane
+        @param count maximum amount of items
+        @param timeout maximum time to wait for the items in seconds
+
+        @return list of items. Empty if none arrived in time
+        """
+        self._cond.acquire()
+        try:
+            items = []
+            end = time.time() + timeout
+            entries = self._lanes[lane]
+            while len(items) < count and not self._interrupted:
+                if any(len(self._lanes[higher]) > 0 for higher in range(lane)):
+                    break
+                if len(entries) == 0:
+                    remaining = end - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                    continue
+                entry = entries.popleft()
+                self._forget(entry)
+                self._account(lane, time.time() - entry[0])
+                items.append(entry[1])
+            return items
+        finally:
+            self._cond.release()
+
+
+    def _forget(self, entry):
+        """
+        Stop coalescing into an entry leaving the queue. Lock must be held by the caller
+
+        @param entry [timestamp, item, key] entry
+        """
+        if entry[2] is not None:
+            del self._keyed[entry[2]]
+
+
+    def _size(self):
+        """
+        Amount of items queued. Lock must be held by the caller
+        """
+        return sum(len(entries) for entries in self._lanes)
+
+
+    def _account(self, lane, wait):
+        """
+        Update latency stats of a lane
+
+        @param lane priority lane
+        @param wait time spent by the item in the queue
+        """
+        stats = self._stats[lane]
+        stats[0] += 1
+        stats[1] += wait
+        if wait > stats[2]:
+            stats[2] = wait
+
+
+    def empty(self):
+        """
+        @return True if there are no items queued
+        """
+        self._cond.acquire()
+        try:
+            return self._size() == 0
+        finally:
+            self._cond.release()
+
+
+    def qsize(self):
+        """
+        @return amount of items queued
+        """
+        self._cond.acquire()
+        try:
+            return self._size()
+        finally:
+            self._cond.release()
+
+
+    def interrupt(self):
+        """
+        Make pending and later get_batch calls return the items taken so far
+        without waiting any longer. Used when shutting down
+        """
+        self._cond.acquire()
+        try:
+            self._interrupted = True
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+
+
+    def drain(self):
+        """
+        Take every item left in the queue
+
+        @return list of items, highest priority first
+        """
+        self._cond.acquire()
+        try:
+            items = []
+            for entries in self._lanes:
+                items.extend(entry[1] for entry in entries)
+                entries.clear()
+            self._keyed.clear()
+            return items
+        finally:
+            self._cond.release()
+
+
+    def oldest_age(self):
+        """
+        Get age of the oldest item in the queue
+
+        @return age in seconds. 0 if the queue is empty
+        """
+        self._cond.acquire()
+        try:
+            heads = [entries[0][0] for entries in self._lanes if len(entries) > 0]
+            if len(heads) == 0:
+                return 0
+            return time.time() - min(heads)
+        finally:
+            self._cond.release()
+
+
+    def footprint(self):
+        """
+        Get memory taken by the queued items
+
+        @return dictionary with the amount of items and their approximate size in bytes
+        """
+        self._cond.acquire()
+        try:
+            size = sys.getsizeof(self._keyed)
+            items = 0
+            for entries in self._lanes:
+                items += len(entries)
+                size += sys.getsizeof(entries)
+                for entry in entries:
+                    size += sys.getsizeof(entry) + sys.getsizeof(entry[1])
+                    if isinstance(entry[1], tuple):
+                        size += sum(sys.getsizeof(field) for field in entry[1])
+            return {"items": items, "bytes": size}
+        finally:
+            self._cond.release()
+
+
+    def report(self):
+        """
+        Get latency stats per lane and start a new reporting period
+
+        @return dictionary of lanes with the amount of items served and their average and
+        maximum time in the queue (ms). Lanes with no traffic are omitted
+        """
+        self._cond.acquire()
+        try:
+            report = {}
+            for lane, stats in enumerate(self._stats):
+                if stats[0] > 0:
+                    report[Lane.labels[lane]] = {"count": stats[0],
+                                                 "avg": round(stats[1] * 1000 / stats[0], 1),
+                                                 "max": round(stats[2] * 1000, 1),
+                                                 "queued": len(self._lanes[lane])}
+                self._stats[lane] = [0, 0.0, 0.0]
+            return report
+        finally:
+            self._cond.release()
+
+
+    def __init__(self, max_wait=1.0, maxsize=None):
+        """
+        Class constructor
+
+        @param max_wait maximum time in seconds items from lower lanes can be
+        overtaken by items from higher lanes
+        @param maxsize maximum amount of items queued. Unlimited if None
+        """
+        ## Maximum waiting time before an item is served regardless of its lane
+        self.max_wait = max_wait
+        ## Maximum amount of items
+        self.maxsize = maxsize
+        ## Items discarded because of a full queue
+        self.dropped = 0
+        ## Items replaced by a newer item with the same key
+        self.coalesced = 0
+        # One deque of [timestamp, item, key] entries per lane
+        self._lanes = [collections.deque() for lane in Lane.labels]
+        # Queued entries per coalescing key
+        self._keyed = {}
+        # Served items, accumulated and maximum waiting time per lane
+        self._stats = [[0, 0.0, 0.0] for lane in Lane.labels]
+        # True if the last item served came from a starving lane
+        self._served_starving = False
+        # get_batch no longer waits once interrupted
+        self._interrupted = False
+        self._cond = threading.Condition()
+
+
+class LaneClassifier:
+    """
+    Assign priority lanes to uplink and downlink packets
+    """
+    def uplink_lane(self, packet):
+        """
+        Get lane of a packet received from the modem
+
+        @param packet packet, including the RSSI/LQI header
+
+        @return priority lane
+        """
+        return self._packet_lane(packet, GwapPacket.HEADER_LENGTH)
+
+
+    def downlink_lane(self, packet, subtopic=""):
+        """
+        Get lane of a packet received from the control topic
+
+        @param packet packet to be transmitted
+        @param subtopic control subtopic the packet was received from
+
+        @return priority lane
+        """
+        lane = self.subtopics.get(subtopic)
+        if lane is not None:
+            return lane
+        return self._packet_lane(packet, 0)
+
+
+    def _packet_lane(self, packet, offset):
+        """
+        Classify packet by device address and function code
+
+        @param packet packet in hex format
+        @param offset position of the device address within the packet
+
+        @return priority lane
+        """
+        lane = self.addresses.get(packet[offset:offset + GwapPacket.ADDRESS_LENGTH])
+        if lane is not None:
+            return lane
+        if len(self.functions) > 0:
+            function = packet[offset + GwapPacket.FUNCTION_OFFSET:offset + GwapPacket.REGID_OFFSET]
+            lane = self.functions.get(function)
+            if lane is not None:
+                return lane
+        return Lane.NORMAL
+
+
+    def __init__(self, addresses={}, functions={}, subtopics={}):
+        """
+        Class constructor
+
+        @param addresses lane name per device address
+        @param functions lane name per GWAP function name (status, query, command)
+        @param subtopics lane name per control subtopic
+        """
+        ## Lane per device address
+        self.addresses = dict((address.upper(), Lane.names[lane]) for address, lane in addresses.items())
+        ## Lane per function code in hex format
+        self.functions = dict(("%02X" % GwapPacket.Function.names[function], Lane.names[lane]) for function, lane in functions.items())
+        ## Lane per control subtopic
+        self.subtopics = dict((subtopic, Lane.names[lane]) for subtopic, lane in subtopics.items())
@@ -0,0 +1,313 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+from gwap import GwapPacket
+from array import array
+import binascii
+import threading
+import time, sys
+
+
+def _rssi_dbm(raw):
+    """
+    Convert raw RSSI from the radio into dBm
+
+    @param raw raw RSSI (0-255)
+
+    @return RSSI in dBm
+    """
+    if raw >= 128:
+        return (raw - 256) / 2.0 - 74
+    return raw / 2.0 - 74
+
+
+def _percentile(values, percent):
+    """
+    Nearest-rank percentile
+
+    @param values sorted list of values
+    @param percent percentile (0-100)
+
+    @return percentile value
+    """
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def _slope(values):
+    """
+    Least squares slope of a series of values
+
+    @param values list of values, oldest first
+
+    @return slope per sample. 0 if there are less than two values
+    """
+    count = len(values)
+    if count < 2:
+        return 0.0
+    x_mean = (count - 1) / 2.0
+    y_mean = sum(values) / float(count)
+    numerator = sum((x - x_mean) * (y - y_mean) for x, y in enumerate(values))
+    denominator = sum((x - x_mean) ** 2 for x in range(count))
+    return numerator / denominator
+
+
+class LinkQuality:
+    """
+    Link quality per device. Raw RSSI, LQI and nonce of every frame are stored
+    in flat rolling windows, one per device, so that receiving a frame only
+    takes a few array writes. Percentiles, trends and packet loss are worked
+    out for all devices at once when a report is requested
+    """
+    ## RSSI in dBm per raw value
+    RSSI_DBM = [_rssi_dbm(raw) for raw in range(256)]
+    ## Nonce gaps longer than this are taken as device restarts rather than losses
+    MAX_GAP = 64
+
+
+    def packet_received(self, packet):
+        """
+        Account frame received
+
+        @param packet frame received, including the RSSI/LQI header
+        """
+        try:
+            rssi = int(packet[1:3], 16)
+            lqi = int(packet[3:5], 16) & 0x7F
+            offset = GwapPacket.HEADER_LENGTH
+            key = binascii.unhexlify(packet[offset:offset + GwapPacket.ADDRESS_LENGTH])
+            nonce = int(packet[offset + GwapPacket.NONCE_OFFSET:offset + GwapPacket.FUNCTION_OFFSET], 16)
+        except (ValueError, TypeError, binascii.Error):
+            return
+        now = time.time()
+
+        self._lock.acquire()
+        try:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._new_slot(key, now)
+            position = slot * self.window + self._count[slot] % self.window
+            self._rssi[position] = rssi
+            self._lqi[position] = lqi
+            self._count[slot] += 1
+            self._received[slot] += 1
+            self._last[slot] = now
+
+            last_nonce = self._nonce[slot]
+            if last_nonce >= 0:
+                gap = (nonce - last_nonce) & 0xFF
+                if 1 < gap <= LinkQuality.MAX_GAP:
+                    self._lost[slot] += gap - 1
+            self._nonce[slot] = nonce
+        finally:
+            self._lock.release()
+
+
+    def packet_dropped(self, packet):
+        """
+        Account frame dropped on purpose before reaching the analytics, such as
+        by rate limits. Its nonce is taken as the last one seen so that it is
+        not counted as lost
+
+        @param packet frame received, including the RSSI/LQI header
+        """
+        try:
+            offset = GwapPacket.HEADER_LENGTH
+            key = binascii.unhexlify(packet[offset:offset + GwapPacket.ADDRESS_LENGTH])
+            nonce = int(packet[offset + GwapPacket.NONCE_OFFSET:offset + GwapPacket.FUNCTION_OFFSET], 16)
+        except (ValueError, TypeError, binascii.Error):
+            return
+
+        self._lock.acquire()
+        try:
+            slot = self._slots.get(key)
+            if slot is not None:
+                self._nonce[slot] = nonce
+        finally:
+            self._lock.release()
+
+
+    def _new_slot(self, key, now):
+        """
+        Allocate slot for a new device, evicting the least recently heard
+        devices when the table is full. Lock must be held by the caller
+
+        @param key binary device address
+        @param now current time
+
+        @return slot index
+        """
+        if len(self._slots) >= self.max_devices:
+            # Free the oldest 10% of the table at once
+            items = [(self._last[slot], dev) for dev, slot in self._slots.iteritems()]
+            items.sort()
+            for last, dev in items[:max(1, self.max_devices / 10)]:
+                self._free.append(self._slots.pop(dev))
+
+        if len(self._free) > 0:
+            slot = self._free.pop()
+            self._count[slot] = 0
+            self._received[slot] = 0
+            self._lost[slot] = 0
+            self._nonce[slot] = -1
+        else:
+            slot = len(self._count)
+            self._rssi.extend(self._empty)
+            self._lqi.extend(self._empty)
+            self._count.append(0)
+            self._received.append(0)
+            self._lost.append(0)
+            self._nonce.append(-1)
+            self._last.append(now)
+        self._slots[key] = slot
+        return slot
+
+
+    def report(self):
+        """
+        Get link quality summary and start a new reporting period
+
+        @return dictionary with RSSI (dBm) and LQI percentiles and the estimated packet
+        loss of all the devices heard in the period, plus the devices with the worst
+        median RSSI. Only frames received in the period are taken into account, up to
+        the last window frames per device. None if no frame was received
+        """
+        # Take a copy of the frames received in this period
+        self._lock.acquire()
+        try:
+            devices = []
+            window = self.window
+            for key, slot in self._slots.iteritems():
+                received = self._received[slot]
+                if received == 0:
+                    continue
+                count = self._count[slot]
+                start = slot * window
+                # Position of the next write and amount of samples of this period
+                head = count % window
+                samples = min(received, window)
+                if samples <= head:
+                    rssi = self._rssi[start + head - samples:start + head]
+                    lqi = self._lqi[start + head - samples:start + head]
+                else:
+                    # Oldest first, wrapping around the end of the window
+                    split = start + window - (samples - head)
+                    end = start + window
+                    rssi = self._rssi[split:end] + self._rssi[start:start + head]
+                    lqi = self._lqi[split:end] + self._lqi[start:start + head]
+                devices.append((key, received, self._lost[slot], rssi, lqi))
+                self._received[slot] = 0
+                self._lost[slot] = 0
+        finally:
+            self._lock.release()
+
+        if len(devices) == 0:
+            return None
+
+        # Work out stats out of the lock
+        dbm = LinkQuality.RSSI_DBM
+        all_rssi = []
+        all_lqi = []
+        total_received = 0
+        total_lost = 0
+        stats = []
+        for key, received, lost, rssi, lqi in devices:
+            values = map(dbm.__getitem__, rssi)
+            ordered = sorted(values)
+            lqi = sorted(lqi)
+            all_rssi.extend(ordered)
+            all_lqi.extend(lqi)
+            total_received += received
+            total_lost += lost
+            stats.append((_percentile(ordered, 50), key, received, lost, ordered, lqi, values))
+
+        all_rssi.sort()
+        all_lqi.sort()
+        report = {"devices": len(devices),
+                  "frames": total_received,
+                  "rssi": [_percentile(all_rssi, 10), _percentile(all_rssi, 50), _percentile(all_rssi, 90)],
+                  "lqi": [_percentile(all_lqi, 10), _percentile(all_lqi, 50), _percentile(all_lqi, 90)],
+                  "loss": round(float(total_lost) / (total_lost + total_received), 4)}
+
+        stats.sort()
+        worst = []
+        for median, key, received, lost, ordered, lqi, values in stats[:self.worst]:
+            worst.append({"address": binascii.hexlify(key).upper(),
+                          "frames": received,
+                          "rssi": [ordered[0], median, ordered[-1]],
+                          "lqi": _percentile(lqi, 50),
+                          "loss": round(float(lost) / (lost + received), 4),
+                          # RSSI change along the period, in dB
+                          "trend": round(_slope(values) * (len(values) - 1), 1)})
+        report["worst"] = worst
+        return report
+
+
+    def footprint(self):
+        """
+        Get memory taken by the per-device windows
+
+        @return dictionary with the amount of devices tracked and their approximate size in bytes
+        """
+        self._lock.acquire()
+        try:
+            size = sys.getsizeof(self._slots) + sys.getsizeof(self._free)
+            size += sum(sys.getsizeof(key) for key in self._slots)
+            for state in (self._rssi, self._lqi, self._count, self._received, self._lost, self._nonce, self._last):
+                size += state.itemsize * len(state)
+            return {"items": len(self._slots), "bytes": size}
+        finally:
+            self._lock.release()
+
+
+    def __init__(self, window=32, max_devices=10000, worst=5):
+        """
+        Class constructor
+
+        @param window amount of frames kept per device
+        @param max_devices maximum amount of devices tracked
+        @param worst amount of devices with the worst RSSI reported individually
+        """
+        ## Frames per window
+        self.window = window
+        ## Maximum amount of devices
+        self.max_devices = max_devices
+        ## Devices reported individually
+        self.worst = worst
+        # Slot per binary device address
+        self._slots = {}
+        # Released slots
+        self._free = []
+        # Rolling windows of raw RSSI and LQI, one window per slot
+        self._rssi = array("B")
+        self._lqi = array("B")
+        self._empty = array("B", [0] * window)
+        # Per-slot state
+        self._count = array("L")
+        self._received = array("L")
+        self._lost = array("L")
+        self._nonce = array("h")
+        self._last = array("d")
+        self._lock = threading.Lock()
@@ -0,0 +1,205 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+from stationlogger import get_logger
+import threading
+import time
+import gc
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def process_memory():
+    """
+    Get memory used by the process (Linux only)
+
+    @return dictionary with the current and peak resident set size in kB. Empty if not available
+    """
+    memory = {}
+    try:
+        status = open("/proc/self/status")
+        for line in status:
+            if line.startswith("VmRSS:"):
+                memory["rss"] = int(line.split()[1])
+            elif line.startswith("VmHWM:"):
+                memory["peak"] = int(line.split()[1])
+        status.close()
+    except (IOError, ValueError, IndexError):
+        pass
+    return memory
+
+
+class MemoryProfiler(threading.Thread):
+    """
+    Memory accounting. Reports process memory, growth of live objects per type
+    since the previous report, the largest allocation growth per source line
+    (only where tracemalloc is available) and the items and bytes held by every
+    registered subsystem. Reports are taken on demand or every period seconds,
+    always from the memory thread
+    """
+    ## Minimum time between reports taken on demand, in seconds. Every MQTT
+    ## client receives the same control request
+    MIN_INTERVAL = 1.0
+
+
+    def run(self):
+        """
+        Publish reports on request and periodically
+        """
+        while True:
+            if self.period > 0:
+                self._requested.wait(self.period)
+            else:
+                self._requested.wait()
+            self.report()
+            self._last_report = time.time()
+            self._requested.clear()
+
+
+    def request(self):
+        """
+        Request a memory report. Only sets a flag, so it can be called from
+        signal handlers and network threads
+
+        @return True if a new report was requested. False if a report is already pending
+        or the last one was taken less than MIN_INTERVAL seconds ago
+        """
+        if self._requested.is_set() or time.time() - self._last_report < MemoryProfiler.MIN_INTERVAL:
+            return False
+        self._requested.set()
+        return True
+
+
+    def register(self, name, footprint):
+        """
+        Register subsystem
+
+        @param name subsystem name
+        @param footprint function returning a dictionary with the amount of items and bytes held
+        """
+        self._subsystems[name] = footprint
+
+
+    def snapshot(self):
+        """
+        Take memory snapshot and compare it with the previous one
+
+        @return dictionary with process memory, object counts, growth and subsystem footprints
+        """
+        self._lock.acquire()
+        try:
+            snapshot = process_memory()
+
+            # Live objects per type
+            counts = {}
+            objects = gc.get_objects()
+            for obj in objects:
+                name = type(obj).__name__
+                counts[name] = counts.get(name, 0) + 1
+            snapshot["objects"] = len(objects)
+            del objects
+            if self._counts is not None:
+                growth = [(counts[name] - self._counts.get(name, 0), name) for name in counts]
+                growth = [(delta, name) for delta, name in growth if delta > 0]
+                growth.sort(reverse=True)
+                snapshot["growth"] = dict((name, delta) for delta, name in growth[:self.top])
+            self._counts = counts
+
+            # Allocation growth per source line
+            if tracemalloc is not None and tracemalloc.is_tracing():
+                traces = tracemalloc.take_snapshot()
+                if self._traces is not None:
+                    stats = traces.compare_to(self._traces, "lineno")[:self.top]
+                    snapshot["allocations"] = dict((str(stat.traceback), stat.size_diff) for stat in stats)
+                self._traces = traces
+
+            subsystems = {}
+            for name, footprint in self._subsystems.items():
+                subsystems[name] = footprint()
+            snapshot["subsystems"] = subsystems
+            return snapshot
+        finally:
+            self._lock.release()
+
+
+    def report(self):
+        """
+        Take snapshot, check it against the RSS budget and publish it
+        """
+        snapshot = self.snapshot()
+        if self.rss_budget is not None and snapshot.get("rss", 0) > self.rss_budget:
+            self._logger.warning("memory", "RSS of " + str(snapshot["rss"]) + " kB over the budget of " + str(self.rss_budget) + " kB")
+        if self.publish is not None:
+            self.publish(snapshot)
+
+
+    def control_received(self, payload):
+        """
+        Memory report request received from the control topic
+
+        @param payload ignored
+        """
+        self.request()
+
+
+    def __init__(self, publish, period=0, top=10, rss_budget=None, trace_frames=0):
+        """
+        Class constructor
+
+        @param publish function publishing memory reports
+        @param period reporting period in seconds. Reports are only taken on demand if 0
+        @param top amount of object types and source lines reported
+        @param rss_budget maximum resident set size in kB. No budget if None
+        @param trace_frames frames stored per allocation by tracemalloc. Disabled if 0
+        """
+        threading.Thread.__init__(self, name="memory")
+        # Configure thread as daemon
+        self.daemon = True
+        ## Report publication function
+        self.publish = publish
+        ## Reporting period
+        self.period = period
+        ## Amount of entries reported
+        self.top = top
+        ## RSS budget
+        self.rss_budget = rss_budget
+        # Footprint function per subsystem
+        self._subsystems = {}
+        # Object counts per type in the last snapshot
+        self._counts = None
+        # Last tracemalloc snapshot
+        self._traces = None
+        # Report requested
+        self._requested = threading.Event()
+        # Time stamp of the last report
+        self._last_report = 0
+        self._lock = threading.Lock()
+        self._logger = get_logger()
+        if trace_frames > 0 and tracemalloc is not None:
+            tracemalloc.start(trace_frames)
@@ -0,0 +1,230 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+"""
+Soak test of the queues and tables of the station
+
+  python memorysoak.py -r 20 -f 50000 -d 20000
+
+Synthetic frames from a device population larger than the tables are
+driven through the frame validator, rate limiter, link quality tables,
+channel planner, downlink tracker, uplink queue and logger. A memory
+snapshot is taken after every round. The test passes when, over the second
+half of the rounds, the resident set size stays within a tolerance and the
+items held by every structure show no upward trend. Exits with status 1
+otherwise
+"""
+
+from memoryprofiler import MemoryProfiler, process_memory
+from framevalidator import FrameValidator
+from ratelimiter import RateLimiter
+from linkquality import LinkQuality
+from channelplanner import ChannelPlanner
+from downlinktracker import DownlinkTracker
+from lanequeue import LaneQueue
+from stationlogger import get_logger
+from config import LogConfig
+import argparse
+import random
+import time
+import sys
+import os
+
+
+class SoakModem:
+    """
+    Modem already on its channel, as seen by the channel planner
+
+    @param portname name of the serial port
+    @param channel frequency channel
+    """
+    def __init__(self, portname, channel):
+        ## Name of the serial port
+        self.portname = portname
+        ## Frequency channel
+        self.freq_channel = channel
+
+
+class SoakManager:
+    """
+    Modem manager owning a SoakModem
+
+    @param modem SoakModem object
+    """
+    def __init__(self, modem):
+        ## Serial modem
+        self.modem = modem
+
+
+def frame(address, nonce, function, regid):
+    """
+    Build frame as received from the modem
+
+    @param address device address (integer)
+    @param nonce transaction nonce
+    @param function GWAP function code
+    @param regid register id
+
+    @return frame with RSSI/LQI header
+    """
+    return "(%02X%02X)%024X%02X%02X%02X%08X" % (random.randint(0, 255), random.randint(0, 127), address,
+                                                 nonce & 0xFF, function, regid, random.randint(0, 0xFFFFFFFF))
+
+
+def trend(values):
+    """
+    Least squares slope of a series of values
+
+    @param values list of values, oldest first
+
+    @return slope per value
+    """
+    count = len(values)
+    if count < 2:
+        return 0.0
+    x_mean = (count - 1) / 2.0
+    y_mean = sum(values) / float(count)
+    numerator = sum((x - x_mean) * (y - y_mean) for x, y in enumerate(values))
+    return numerator / sum((x - x_mean) ** 2 for x in range(count))
+
+
+def soak(rounds, frames, devices, max_devices, tolerance):
+    """
+    Run soak test
+
+    @param rounds amount of rounds
+    @param frames frames per round
+    @param devices size of the device population
+    @param max_devices maximum amount of devices tracked by every table
+    @param tolerance maximum growth of the resident set size over the second half, in kB
+
+    @return True if memory levelled off
+    """
+    logger = get_logger()
+    validator = FrameValidator()
+    limiter = RateLimiter(1.0, 10, 100, 600, max_devices)
+    link_quality = LinkQuality(32, max_devices)
+    managers = [SoakManager(SoakModem("soak" + str(channel), channel)) for channel in range(2)]
+    planner = ChannelPlanner([0, 1], max_devices=max_devices)
+    planner.assign(managers)
+    outbox = LaneQueue(maxsize=10000)
+    downlinks = []
+    tracker = DownlinkTracker(lambda packet, lane, key: downlinks.append(packet), lambda status: None,
+                              timeout=0.05, deadline=0.2)
+    tracker.start()
+
+    memory = MemoryProfiler(None)
+    memory.register("logger", logger.footprint)
+    memory.register("ratelimit", limiter.footprint)
+    memory.register("linkquality", link_quality.footprint)
+    memory.register("planner", planner.footprint)
+    memory.register("outbox", outbox.footprint)
+    memory.register("downlinks", tracker.footprint)
+
+    nonces = {}
+    history = []
+    print "%5s %8s %8s  %s" % ("round", "rss kB", "objects", "items per structure")
+    for round_number in range(rounds):
+        for index in range(frames):
+            address = random.randint(0, devices - 1)
+            nonce = nonces.get(address, 0) + 1
+            nonces[address] = nonce
+            packet = frame(address, nonce, 0, random.randint(0, 15))
+            if index % 50 == 0:
+                # Line noise
+                packet = packet[:random.randint(1, len(packet))]
+            if not validator.validate(packet):
+                continue
+            if not limiter.allow(packet[6:30]):
+                link_quality.packet_dropped(packet)
+                continue
+            link_quality.packet_received(packet)
+            planner.packet_received(managers[address % 2], packet)
+            tracker.packet_received(packet)
+            logger.debug("rx", packet, "soak", "<")
+            outbox.put(("network/" + packet[6:30], packet, 0))
+            # Publisher slower than the modem now and then
+            if index % 3 != 0:
+                outbox.get(0)
+            if index % 20 == 0:
+                # Downlink query, answered or not, sometimes to devices never heard
+                downlink = "%024X%02X01%02X" % (random.randint(0, devices * 2 - 1), nonce & 0xFF, random.randint(0, 15))
+                planner.select(downlink)
+                tracker.sent(downlink, 1)
+        # Reports start new periods, as with every heart beat
+        validator.report()
+        limiter.report()
+        link_quality.report()
+        outbox.report()
+        del downlinks[:]
+        logger.flush(5.0)
+        # Downlinks still pending after their deadline are leaked
+        time.sleep(tracker.deadline + 0.1)
+
+        snapshot = memory.snapshot()
+        items = dict((name, footprint["items"]) for name, footprint in snapshot["subsystems"].items())
+        history.append((snapshot.get("rss", 0), items))
+        print "%5d %8d %8d  %s" % (round_number + 1, snapshot.get("rss", 0), snapshot["objects"],
+                                   " ".join("%s=%d" % item for item in sorted(items.items())))
+        sys.stdout.flush()
+    tracker.stop()
+
+    # Trends over the second half, once tables are full
+    second = history[len(history) / 2:]
+    rss_growth = max(rss for rss, items in second) - second[0][0]
+    success = rss_growth <= tolerance
+    print "RSS growth over the second half: %d kB (tolerance %d kB)" % (rss_growth, tolerance)
+    for name in sorted(second[0][1]):
+        counts = [items[name] for rss, items in second]
+        mean = sum(counts) / float(len(counts))
+        growth = trend(counts) * (len(counts) - 1)
+        # Structures following the traffic fluctuate around their mean
+        if growth > mean * 0.1 + 10:
+            print "%s keeps growing: %+d items over the second half, %d on average" % (name, growth, mean)
+            success = False
+    print "PASS" if success else "FAIL"
+    return success
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Soak test of the station queues and tables")
+    parser.add_argument("-r", "--rounds", type=int, default=20, help="amount of rounds")
+    parser.add_argument("-f", "--frames", type=int, default=50000, help="frames per round")
+    parser.add_argument("-d", "--devices", type=int, default=20000, help="size of the device population")
+    parser.add_argument("-m", "--maxdevices", type=int, default=5000, help="maximum devices per table")
+    parser.add_argument("-t", "--tolerance", type=int, default=1024, help="RSS growth tolerated over the second half, in kB")
+    parser.add_argument("-o", "--output", default=os.devnull, help="log file")
+    args = parser.parse_args()
+
+    if "rss" not in process_memory():
+        print "Resident set size not available on this system"
+    get_logger().configure(LogConfig({"file": args.output}))
+    random.seed(0)
+    start = time.time()
+    success = soak(args.rounds, args.frames, args.devices, args.maxdevices, args.tolerance)
+    print "%.1f s" % (time.time() - start)
+    sys.exit(0 if success else 1)
@@ -27,12 +27,26 @@ __date__  ="Apr 22, 2016"
 from serialmodem import SerialModem
 from mqttclient import MqttClient
 from stationexception import StationException
+from watchdog import Watchdog
+from ratelimiter import RateLimiter
+from lanequeue import LaneClassifier, Lane
+from downlinktracker import DownlinkTracker
+from framevalidator import FrameValidator
+from gwap import GwapPacket
+from uplinkcompressor import UplinkCompressor
+from linkquality import LinkQuality
+from config import WatchdogConfig
+from startuptimer import get_startup_timer
+import threading
+import time, os, json
 
 
 class ModemManager():
     """
     Serial modem management Class
     """
+    ## Largest value of every modem setting accepted from the control topic
+    SETTING_LIMITS = {"channel": 0xFF, "syncword": 0xFFFF, "address": 0xFF}
     
     def serial_packet_received(self, packet):
         """
@@ -40,19 +54,256 @@ class ModemManager():
         
         @param packet serial packet received
         """
-        self.mqtt_client.publish_network_status(packet)
+        if not self.accepting:
+            self.refused += 1
+            return
+        # Drop frames from flooding devices before doing anything else
+        if self.limiter is not None and not self.limiter.allow(packet[6:30]):
+            self.frames_ratelimited += 1
+            if self.link_quality is not None:
+                # Deliberate drops are not link losses
+                self.link_quality.packet_dropped(packet)
+            return
+        if self.link_quality is not None:
+            self.link_quality.packet_received(packet)
+        if self.planner is not None:
+            self.planner.packet_received(self, packet)
+        if self.tracker is not None:
+            self.tracker.packet_received(packet)
+        lane = Lane.NORMAL
+        if self.classifier is not None:
+            lane = self.classifier.uplink_lane(packet)
+        if self.sequence:
+            # Port and sequence number, for gap detection by the consumers
+            packet += ";" + self._port_id + ":" + str(self.modem.get_serial_port().rx_sequence)
+        self.frames_sunk += 1
+        self.mqtt_client.publish_network_status(packet, lane)
 
 
-    def mqtt_packet_received(self, packet):
+    def send_heartbeat(self, status):
+        """
+        Publish gateway heart beat
+        
+        @param status health status
+        """
+        self.mqtt_client.publish_gateway_status(status)
+        
+        # Frames rejected by the validator
+        if self.validator is not None:
+            report = self.validator.report()
+            if report is not None:
+                self.mqtt_client.publish_gateway_report("rejected", report)
+        
+        # Frames dropped by the rate limiter
+        if self.limiter is not None:
+            report = self.limiter.report()
+            if report is not None:
+                self.mqtt_client.publish_gateway_report("ratelimit", report)
+
+        # Latency per priority lane
+        if self.classifier is not None:
+            report = {"tx": self.modem.get_serial_port().txqueue_report(), "uplink": self.mqtt_client.outbox_report()}
+            self.mqtt_client.publish_gateway_report("lanes", report)
+
+        # Frames accounted at every stage
+        self.mqtt_client.publish_gateway_report("pipeline", self.pipeline_report())
+
+        # Link quality summary
+        if self.link_quality is not None:
+            report = self.link_quality.report()
+            if report is not None:
+                report["port"] = self.modem.portname
+                self.mqtt_client.publish_gateway_report("linkquality", report)
+
+        # Downlinks saved by coalescing
+        if len(self.coalesce_subtopics) > 0:
+            coalesced = self.modem.get_serial_port().coalesced()
+            if coalesced > self._coalesced_reported:
+                self.mqtt_client.publish_gateway_report("coalesced", {"saved": coalesced - self._coalesced_reported,
+                                                                      "total": coalesced})
+                self._coalesced_reported = coalesced
+
+
+    def mqtt_packet_received(self, packet, subtopic=""):
         """
         Function called whenever a MQTT message is received
         
         @param packet mqtt packet received
+        @param subtopic control subtopic the packet was published on
+        """
+        if not self.accepting:
+            self.refused += 1
+            return
+        if self.planner is not None:
+            # Only the modem on the channel of the device transmits
+            if self.planner.select(packet) is not self:
+                return
+            self.planner.packet_sent(self, packet)
+        lane = Lane.NORMAL
+        if self.classifier is not None:
+            lane = self.classifier.downlink_lane(packet, subtopic)
+        key = None
+        if subtopic in self.coalesce_subtopics:
+            # Newer downlinks replace pending ones for the same device, function and register
+            try:
+                gwap = GwapPacket(packet)
+                key = (gwap.address, gwap.function, gwap.regid)
+            except ValueError:
+                pass
+        if self.tracker is not None:
+            self.tracker.sent(packet, lane, key)
+        else:
+            self.modem.send(packet, lane, key)
+
+
+    def footprint(self):
+        """
+        Get memory taken by the queues and tables of this modem
+        
+        @return dictionary of subsystems with the amount of items and bytes held
+        """
+        footprint = {"txqueue": self.modem.get_serial_port().txqueue_footprint(),
+                     "outbox": self.mqtt_client.outbox_footprint()}
+        if self.limiter is not None:
+            footprint["ratelimit"] = self.limiter.footprint()
+        if self.tracker is not None:
+            footprint["downlinks"] = self.tracker.footprint()
+        if self.link_quality is not None:
+            footprint["linkquality"] = self.link_quality.footprint()
+        return footprint
+
+
+    def pipeline_report(self):
         """
-        self.modem.send(packet)
+        Get amount of frames that went through every stage of the uplink pipeline
+        since start. Serial lines are framed, then either taken as modem messages or
+        validated as radio frames, handed to the MQTT client, published and
+        acknowledged. Frames lost between stages are attributed
         
+        @return dictionary of counters
+        """
+        serial_port = self.modem.get_serial_port()
+        report = {"port": self.modem.portname,
+                  "framed": serial_port.rx_sequence,
+                  "modem": self.modem.modem_lines,
+                  "unhandled": self.modem.frames_unhandled,
+                  "callback": serial_port.callback_errors,
+                  "validated": self.modem.frames_validated,
+                  "ratelimited": self.frames_ratelimited,
+                  "refused": self.refused,
+                  "sunk": self.frames_sunk}
+        if self.validator is not None:
+            report["rejected"] = self.validator.total_rejected
+        report.update(self.mqtt_client.pipeline_report())
+        return report
+
+
+    def stop_input(self):
+        """
+        Stop accepting frames from the modem and downlinks from the broker
+        """
+        self.accepting = False
+        self.watchdog.stop()
+        if self.tracker is not None:
+            self.tracker.stop()
+
+
+    def pending(self):
+        """
+        Get amount of packets waiting for transmission or publication
+        
+        @return amount of packets
+        """
+        return self.modem.get_serial_port().pending() + self.mqtt_client.pending()
+
+
+    def close(self, status, timeout=1.0):
+        """
+        Publish final gateway status and close serial port and MQTT connection
         
-    def __init__(self, portname, speed, verbose, mqtt_server, mqtt_port, mqtt_topic, user_key, gateway_key, coordinates):
+        @param status final gateway status
+        @param timeout maximum time to wait for the final status to be sent, in seconds
+        """
+        self.mqtt_client.publish_gateway_status(status)
+        end = time.time() + timeout
+        while self.mqtt_client.inflight() > 0 and time.time() < end:
+            time.sleep(0.01)
+        self.modem.stop()
+        self.mqtt_client.stop()
+
+
+    def reconfigure_received(self, payload):
+        """
+        Modem reconfiguration request received from the control topic. Every modem
+        receives the same request, so only the one on the given port applies it.
+        Settings are applied from a separate thread so that the MQTT loop is not blocked
+        
+        @param payload JSON object with the new "channel", "syncword" and/or "address",
+        and the "port" of the modem
+        """
+        try:
+            request = json.loads(payload)
+            port = request.get("port")
+            settings = dict((name, int(request[name])) for name in ModemManager.SETTING_LIMITS if name in request)
+        except (ValueError, TypeError, AttributeError):
+            self.mqtt_client.publish_gateway_report("reconfigure", {"port": self.modem.portname, "status": "INVALID"})
+            return
+        if port is not None and port not in (self.modem.portname, self._port_id):
+            # Request for another modem
+            return
+        if len([name for name, value in settings.items() if not 0 <= value <= ModemManager.SETTING_LIMITS[name]]) > 0:
+            self.mqtt_client.publish_gateway_report("reconfigure", {"port": self.modem.portname, "status": "INVALID"})
+            return
+        if self.planner is not None and "channel" in settings:
+            # Channels are owned by the channel plan
+            self.mqtt_client.publish_gateway_report("reconfigure", {"port": self.modem.portname, "status": "REFUSED"})
+            return
+        if port is None and self.modems > 1 and ("channel" in settings or "address" in settings):
+            # All the modems would end up on the same channel and address
+            self.mqtt_client.publish_gateway_report("reconfigure", {"port": self.modem.portname, "status": "REFUSED"})
+            return
+        if not self._reconfiguring.acquire(False):
+            # Previous request still in progress
+            self.mqtt_client.publish_gateway_report("reconfigure", {"port": self.modem.portname, "status": "BUSY"})
+            return
+        worker = threading.Thread(target=self._reconfigure, args=(settings,), name="reconfigure")
+        worker.daemon = True
+        worker.start()
+
+
+    def _reconfigure(self, settings):
+        """
+        Apply modem settings and publish the outcome along with the time downlinks were held
+        
+        @param settings dictionary of settings. See SerialModem.reconfigure
+        """
+        try:
+            gap = self.modem.reconfigure(**settings)
+        except StationException:
+            gap = None
+        finally:
+            self._reconfiguring.release()
+        report = {"port": self.modem.portname, "status": "OK" if gap is not None else "FAILED"}
+        # No command mode session without settings
+        if gap is not None and len(settings) > 0:
+            report["gap"] = int(gap * 1000)
+        report.update(settings)
+        self.mqtt_client.publish_gateway_report("reconfigure", report)
+
+
+    def publish_downlink_status(self, status):
+        """
+        Publish final status of a tracked downlink
+        
+        @param status dictionary with device address, register, status, attempts and latency
+        """
+        self.mqtt_client.publish_gateway_report("downlink", status)
+        
+        
+    def __init__(self, portname, speed, verbose, mqtt_server, mqtt_port, mqtt_topic, user_key, gateway_key, coordinates, planner=None, watchdog_config=None, ratelimit_config=None, priority_config=None,
+                 mqtt_version=3, session_expiry=0, uplink_qos=0, downlink_config=None,
+                 validation_config=None, coalesce_config=None, compression_config=None,
+                 linkquality_config=None, sequence=False):
         """
         Class constructor
         
@@ -65,17 +316,134 @@ class ModemManager():
         @param user_key User key
         @param gateway_key gateway key
         @param coordinates gateway latitude-longitude
+        @param planner ChannelPlanner object shared by all modems
+        @param watchdog_config WatchdogConfig object
+        @param ratelimit_config RateLimitConfig object. No rate limits if None
+        @param priority_config PriorityConfig object. Single priority lane if None
+        @param mqtt_version MQTT protocol version (3 for 3.1.1 or 5)
+        @param session_expiry MQTT 5 session expiry interval in seconds. 0 for clean sessions
+        @param uplink_qos quality of service of network messages
+        @param downlink_config DownlinkConfig object. Downlinks are not tracked if None
+        @param validation_config ValidationConfig object. Frames are validated with default settings if None
+        @param coalesce_config CoalesceConfig object. Downlinks are never coalesced if None
+        @param compression_config CompressionConfig object. Uplinks are published one by one if None
+        @param linkquality_config LinkQualityConfig object. No link quality analytics if None
+        @param sequence append port and sequence number to every network message
         """
+        ## RF channel planner
+        self.planner = planner
+        
+        ## Accept new frames and downlinks
+        self.accepting = True
+        ## Frames and downlinks refused while shutting down
+        self.refused = 0
+        ## Frames dropped by the rate limiter
+        self.frames_ratelimited = 0
+        ## Frames handed over to the MQTT client
+        self.frames_sunk = 0
+        
+        ## Append sequence numbers to network messages
+        self.sequence = sequence
+        # Port identifier in sequence numbers
+        self._port_id = os.path.basename(portname)
+        
+        ## Amount of modems on the gateway. Channel and address changes must name the port when there are several
+        self.modems = 1
+        # Held while a reconfiguration requested from the control topic is in progress
+        self._reconfiguring = threading.Lock()
+        
+        ## Per-device rate limiter
+        self.limiter = None
+        if ratelimit_config is not None:
+            self.limiter = RateLimiter(ratelimit_config.rate, ratelimit_config.burst, ratelimit_config.quarantine,
+                                       ratelimit_config.quarantine_time, ratelimit_config.max_devices)
+        
+        ## Link quality analytics
+        self.link_quality = None
+        if linkquality_config is not None:
+            self.link_quality = LinkQuality(linkquality_config.window, linkquality_config.max_devices, linkquality_config.worst)
+        
+        ## Priority lane classifier
+        self.classifier = None
+        if priority_config is not None:
+            self.classifier = LaneClassifier(priority_config.addresses, priority_config.functions, priority_config.subtopics)
+        
+        ## Downlink tracker
+        self.tracker = None
+        
+        ## Control subtopics whose downlinks are coalesced
+        self.coalesce_subtopics = []
+        if coalesce_config is not None:
+            self.coalesce_subtopics = coalesce_config.subtopics
+        # Coalesced downlinks already reported
+        self._coalesced_reported = 0
+        
+        ## Frame validator
+        self.validator = None
+        if validation_config is None:
+            self.validator = FrameValidator()
+        elif validation_config.enabled:
+            self.validator = FrameValidator(validation_config.min_length, validation_config.max_length,
+                                            validation_config.samples, validation_config.capture_file)
+        
+        timer = get_startup_timer()
         try:
+            # MQTT client first, so that the broker connection is established
+            # while the modem handshake is in progress
+            # Persistent sessions need a stable client id, one per modem
+            client_id = ""
+            if session_expiry > 0:
+                client_id = gateway_key + "-" + os.path.basename(portname)
+            # Compressed uplink batches
+            compressor = None
+            batch_size = 1
+            max_delay = 1.0
+            if compression_config is not None:
+                dictionary = None
+                if compression_config.dictionary is not None:
+                    dictionary = UplinkCompressor.load(compression_config.dictionary)
+                compressor = UplinkCompressor(dictionary, compression_config.level)
+                batch_size = compression_config.batch_size
+                max_delay = compression_config.max_delay
+            self.mqtt_client = MqttClient(mqtt_server, mqtt_port, mqtt_topic, user_key, gateway_key, coordinates,
+                                          mqtt_version, client_id, session_expiry, uplink_qos,
+                                          compressor, batch_size, max_delay)
+            timer.mark("mqtt client " + portname)
+            
             # Create and start serial modem
-            self.modem = SerialModem(portname, speed, verbose)
+            try:
+                self.modem = SerialModem(portname, speed, verbose)
+            except StationException:
+                # No broker connection for a port without modem
+                self.mqtt_client.stop()
+                del self.mqtt_client
+                raise
             # Declare receiving callback function
+            self.modem.set_frame_validator(self.validator)
             self.modem.set_rx_callback(self.serial_packet_received)
+            timer.mark("modem handshake " + portname)
             
-            # MQTT client
-            self.mqtt_client = MqttClient(mqtt_server, mqtt_port, mqtt_topic, user_key, gateway_key, coordinates)
-            # Declare receiving callback function
+            # Downlinks are only accepted once the modem is ready
             self.mqtt_client.set_rx_callback(self.mqtt_packet_received)
+            # Modem settings changed from the control topic
+            self.mqtt_client.set_control_callback("reconfigure", self.reconfigure_received)
+            
+            # Starvation protection of low priority lanes
+            if priority_config is not None:
+                self.modem.get_serial_port().set_max_wait(priority_config.max_wait)
+                self.mqtt_client.set_max_wait(priority_config.max_wait)
+            
+            # Downlink acknowledgment tracking
+            if downlink_config is not None:
+                self.tracker = DownlinkTracker(self.modem.send, self.publish_downlink_status, downlink_config.timeout,
+                                               downlink_config.backoff, downlink_config.deadline, downlink_config.functions)
+                self.tracker.start()
+            
+            # Health supervision and heart beat
+            if watchdog_config is None:
+                watchdog_config = WatchdogConfig({})
+            self.watchdog = Watchdog(self.modem, self.mqtt_client, self.send_heartbeat, watchdog_config)
+            self.watchdog.start()
             
         except StationException as ex:
             ex.show()
@@ -0,0 +1,220 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+"""
+Measure MQTT bytes on the wire for network messages under MQTT 3.1.1 and
+MQTT 5 with topic aliases
+
+  python mqttbench.py -n 5000 -d 50
+
+Messages are published through MqttClient to a minimal broker stand-in
+listening on localhost, which counts the PUBLISH packets and their size
+"""
+
+from mqttclient import MqttClient
+import argparse
+import threading
+import socket
+import struct
+import time
+
+
+class BrokerStandIn(threading.Thread):
+    """
+    Accept MQTT connections and acknowledge CONNECT, SUBSCRIBE, PUBLISH (QoS 1)
+    and PINGREQ packets. Messages are not delivered to anyone
+    """
+    def run(self):
+        """
+        Serve connections, one thread each
+        """
+        while True:
+            connection, address = self._server.accept()
+            handler = threading.Thread(target=self._handle, args=(connection,), name="broker")
+            handler.daemon = True
+            handler.start()
+
+
+    def _receive(self, connection, length):
+        """
+        Receive a given amount of bytes
+
+        @param connection client socket
+        @param length amount of bytes
+
+        @return bytes received
+        """
+        data = ""
+        while len(data) < length:
+            chunk = connection.recv(length - len(data))
+            if not chunk:
+                raise EOFError()
+            data += chunk
+        return data
+
+
+    def _handle(self, connection):
+        """
+        Serve single connection
+
+        @param connection client socket
+        """
+        version5 = False
+        try:
+            while True:
+                header = ord(self._receive(connection, 1))
+                # Variable length "remaining length" field
+                length = 0
+                multiplier = 1
+                size = 1
+                while True:
+                    byte = ord(self._receive(connection, 1))
+                    size += 1
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if byte & 0x80 == 0:
+                        break
+                body = self._receive(connection, length)
+                packet_type = header >> 4
+
+                if packet_type == 1:
+                    # CONNECT. Protocol level after the protocol name
+                    version5 = ord(body[6]) == 5
+                    if version5:
+                        properties = struct.pack(">BHBH", 0x22, self.alias_maximum, 0x21, self.receive_maximum)
+                        connection.sendall(chr(0x20) + chr(3 + len(properties)) + "\x00\x00" + chr(len(properties)) + properties)
+                    else:
+                        connection.sendall("\x20\x02\x00\x00")
+                elif packet_type == 3:
+                    # PUBLISH
+                    self.lock.acquire()
+                    self.publishes += 1
+                    self.bytes += size + length
+                    self.lock.release()
+                    if (header >> 1) & 0x03 == 1:
+                        topic_length = struct.unpack(">H", body[:2])[0]
+                        connection.sendall("\x40\x02" + body[2 + topic_length:4 + topic_length])
+                elif packet_type == 8:
+                    # SUBSCRIBE
+                    if version5:
+                        connection.sendall("\x90\x04" + body[:2] + "\x00\x00")
+                    else:
+                        connection.sendall("\x90\x03" + body[:2] + "\x00")
+                elif packet_type == 12:
+                    # PINGREQ
+                    connection.sendall("\xd0\x00")
+                elif packet_type == 14:
+                    # DISCONNECT
+                    break
+        except (EOFError, socket.error):
+            pass
+        connection.close()
+
+
+    def reset(self):
+        """
+        Reset counters
+        """
+        self.lock.acquire()
+        self.publishes = 0
+        self.bytes = 0
+        self.lock.release()
+
+
+    def __init__(self, alias_maximum=100, receive_maximum=100):
+        """
+        Class constructor
+
+        @param alias_maximum topic alias maximum announced to MQTT 5 clients
+        @param receive_maximum receive maximum announced to MQTT 5 clients
+        """
+        threading.Thread.__init__(self, name="broker")
+        # Configure thread as daemon
+        self.daemon = True
+        ## Topic alias maximum
+        self.alias_maximum = alias_maximum
+        ## Receive maximum
+        self.receive_maximum = receive_maximum
+        ## PUBLISH packets received
+        self.publishes = 0
+        ## Bytes of the PUBLISH packets received
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self._server = socket.socket()
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(("127.0.0.1", 0))
+        self._server.listen(5)
+        ## Listening port
+        self.port = self._server.getsockname()[1]
+
+
+def run(broker, version, qos, messages, devices):
+    """
+    Publish network messages through MqttClient
+
+    @param broker BrokerStandIn object
+    @param version MQTT version (3 or 5)
+    @param qos quality of service of network messages
+    @param messages amount of messages
+    @param devices amount of distinct device addresses
+
+    @return tuple (PUBLISH packets, bytes) received by the broker
+    """
+    broker.reset()
+    client = MqttClient("127.0.0.1", broker.port, "liberiot", "0123456789ABCDEF0123456789ABCDEF", "02FC00000001",
+                        (0, 0), version, "", 0, qos)
+    end = time.time() + 5
+    while not client.connected and time.time() < end:
+        time.sleep(0.01)
+
+    for index in range(messages):
+        client.publish_network_status("(2A30)%024X%02X00%02X%02X%08X" % (index % devices, index % 256, index % 3,
+                                                                      index % 16, index))
+    end = time.time() + 30
+    while client.pending() > 0 and time.time() < end:
+        time.sleep(0.01)
+    # Let the broker account the last packets
+    time.sleep(0.2)
+    client.stop()
+    return broker.publishes, broker.bytes
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="MQTT bytes on the wire with and without topic aliases")
+    parser.add_argument("-n", "--messages", type=int, default=5000, help="network messages per run")
+    parser.add_argument("-d", "--devices", type=int, default=50, help="distinct device addresses")
+    parser.add_argument("-a", "--aliases", type=int, default=100, help="topic alias maximum of the broker")
+    args = parser.parse_args()
+
+    broker = BrokerStandIn(args.aliases)
+    broker.start()
+
+    print "%-10s %4s %10s %10s %10s" % ("protocol", "qos", "publishes", "bytes", "bytes/msg")
+    for version, qos in ((3, 0), (5, 0), (3, 1), (5, 1)):
+        publishes, size = run(broker, version, qos, args.messages, args.devices)
+        print "%-10s %4d %10d %10d %10.1f" % ("MQTT " + ("5" if version == 5 else "3.1.1"), qos, publishes, size,
+                                               float(size) / max(1, publishes))
@@ -25,26 +25,63 @@ __date__  ="Apr 23, 2016"
 #########################################################################
 
 from stationexception import StationException
+from lanequeue import LaneQueue, Lane
+from startuptimer import get_startup_timer
 import paho.mqtt.client as mqtt
+from paho.mqtt.properties import Properties
+from paho.mqtt.packettypes import PacketTypes
 import threading
+import socket
 import time
+import json
 
 
 class MqttClient(object):
     """
     MQTT client
     """
+    # Maximum amount of uplink messages waiting to be published
+    OUTBOX_SIZE = 10000
+    # Maximum amount of messages handed over to paho and not yet sent (MQTT 3.1.1)
+    DEFAULT_WINDOW = 20
 
-    def on_connect(self, client, userdata, flags, rc):
+    def on_connect(self, client, userdata, flags, rc, properties=None):
         """
         Callback function: connection completed
         """
         print("Connected to MQTT broker " + self.mqtt_server + " on port " + str(self.mqtt_port))
 
+        self.publish_lock.acquire()
+        # Topic aliases only live as long as the connection
+        self._aliases = {}
+        # Messages lost with the previous connection will never be reported as sent
+        self.publish_count = self.sent_count
+        self.publish_lock.release()
+        self._frames_lock.acquire()
+        if self.uplink_qos == 0:
+            self.frames_lost += sum(self._frames_inflight.values())
+            self._frames_inflight = {}
+        else:
+            # Only network messages are retransmitted by paho
+            self._frames_inflight = dict((mid, frames) for mid, frames in self._frames_inflight.items() if frames > 0)
+        self._frames_lock.release()
+
+        session_present = False
+        if self.protocol == mqtt.MQTTv5:
+            session_present = flags.get("session present", 0) == 1
+            self.alias_maximum = getattr(properties, "TopicAliasMaximum", 0)
+            # Do not have more messages in flight than the broker is willing to receive
+            self.window = getattr(properties, "ReceiveMaximum", 65535)
+            client.max_inflight_messages_set(self.window)
+
         # Subscribing in on_connect() means that if we lose the connection and
-        # reconnect then subscriptions will be renewed.
-        topic = self.TOPIC_CONTROL + "/#"
-        client.subscribe(topic)   # Control topic
+        # reconnect then subscriptions will be renewed. Persistent sessions
+        # keep them in the broker
+        if not session_present:
+            topic = self.TOPIC_CONTROL + "/#"
+            client.subscribe(topic)   # Control topic
+        self.connected = True
+        get_startup_timer().mark("broker connected")
         self.publish_gateway_status("CONNECTED")
         
         self.publish_gateway_coord()
@@ -54,24 +91,156 @@ class MqttClient(object):
         """
         Callback function: message published from server
         """
-        if self._packet_received is not None:
-            self._packet_received(msg.payload)
+        # Control subtopics handled by the station itself
+        subtopic = msg.topic[len(self.TOPIC_CONTROL) + 1:]
+        if subtopic in self._control_handlers:
+            self._control_handlers[subtopic](msg.payload)
+        elif self._packet_received is not None:
+            self._packet_received(msg.payload, subtopic)
+
+
+    def on_disconnect(self, client, userdata, rc, properties=None):
+        """
+        Callback function: connection lost
+        """
+        self.connected = False
 
 
-    def publish_network_status(self, message):
+    def on_publish(self, client, userdata, mid):
+        """
+        Callback function: message handed over to the broker
         """
-        Publish network data
+        self.sent_count += 1
+        self.last_sent_time = time.time()
+        # Frames carried by the message
+        self._frames_lock.acquire()
+        frames = self._frames_inflight.pop(mid, None)
+        if frames is not None:
+            self.frames_acked += frames
+        elif len(self._early_acks) < MqttClient.OUTBOX_SIZE:
+            # Completed before _publish() could take note of it
+            self._early_acks.add(mid)
+        self._frames_lock.release()
+
+
+    def _publish(self, topic, payload, qos=0, frames=0):
+        """
+        Publish MQTT message. Under MQTT 5, topics of QoS 0 messages are replaced
+        by topic aliases once the broker knows them. Messages with QoS > 0 always
+        carry the full topic since paho may send them again over a new connection,
+        where aliases from the previous one are unknown
         
-        @param message text to be transmitted via MQTT
+        @param topic MQTT topic
+        @param payload message payload
+        @param qos quality of service
+        @param frames amount of radio frames carried by the message
         """
-        # Extract device address
-        device_address = message[6:30]
         self.publish_lock.acquire()
         try:
-            self.mqtt_client.publish(self.TOPIC_NETWORK + "/" + device_address, payload=message, qos=0, retain=False)
+            properties = None
+            alias = None
+            if self.alias_maximum > 0 and qos == 0:
+                properties = Properties(PacketTypes.PUBLISH)
+                alias = self._aliases.get(topic)
+                if alias is not None:
+                    properties.TopicAlias = alias
+                    topic = ""
+                elif len(self._aliases) < self.alias_maximum:
+                    properties.TopicAlias = len(self._aliases) + 1
+                else:
+                    properties = None
+
+            info = self.mqtt_client.publish(topic, payload=payload, qos=qos, retain=False, properties=properties)
+            if info.rc == mqtt.MQTT_ERR_SUCCESS or qos > 0:
+                self.publish_count += 1
+                self._frames_published(info.mid, frames)
+            else:
+                self.frames_failed += frames
+
+            # The alias is known by the broker once the full topic has been sent along with it
+            if properties is not None and alias is None and info.rc == mqtt.MQTT_ERR_SUCCESS:
+                self._aliases[topic] = properties.TopicAlias
             
         finally:
-            self.publish_lock.release()      
+            self.publish_lock.release()
+
+
+    def _frames_published(self, mid, frames):
+        """
+        Take note of the frames carried by a message until it is sent or acknowledged
+        
+        @param mid message id
+        @param frames amount of frames
+        """
+        self._frames_lock.acquire()
+        try:
+            if mid in self._early_acks:
+                self._early_acks.remove(mid)
+                self.frames_acked += frames
+            else:
+                self._frames_inflight[mid] = frames
+            self.frames_published += frames
+        finally:
+            self._frames_lock.release()
+
+
+    def pipeline_report(self):
+        """
+        Get frame counters of the publication stages
+        
+        @return dictionary with the amount of frames published, acknowledged (sent under
+        QoS 0), lost with a connection, refused by the MQTT client, dropped from the full
+        outbox, still queued and in flight
+        """
+        batched = 0
+        if self._publisher is not None:
+            batched = len(self._publisher.batch)
+        self._frames_lock.acquire()
+        inflight = sum(self._frames_inflight.values())
+        self._frames_lock.release()
+        return {"published": self.frames_published, "acked": self.frames_acked, "lost": self.frames_lost,
+                "failed": self.frames_failed, "overflow": self._outbox.dropped,
+                "queued": self._outbox.qsize() + batched, "inflight": inflight}
+
+
+    def inflight(self):
+        """
+        Get amount of messages handed over to paho and not yet sent or acknowledged
+        
+        @return amount of messages
+        """
+        return self.publish_count - self.sent_count
+
+
+    def publish_network_status(self, message, lane=Lane.NORMAL):
+        """
+        Publish network data. Messages are queued and published from the
+        uplink publisher thread, highest priority first
+        
+        @param message text to be transmitted via MQTT
+        @param lane priority lane
+        """
+        # Extract device address
+        device_address = message[6:30]
+        self._outbox.put((self.TOPIC_NETWORK + "/" + device_address, message, self.uplink_qos), lane)
+
+
+    def outbox_footprint(self):
+        """
+        Get memory taken by the uplink queue
+        
+        @return dictionary with the amount of messages and bytes. See LaneQueue.footprint
+        """
+        return self._outbox.footprint()
+
+
+    def outbox_report(self):
+        """
+        Get latency stats per priority lane of the uplink queue
+        
+        @return dictionary of lanes. See LaneQueue.report
+        """
+        return self._outbox.report()
 
 
     def publish_gateway_status(self, status="RUNNING"):
@@ -80,35 +249,92 @@ class MqttClient(object):
         
         @param status gateway status
         """
-        self.publish_lock.acquire()
-        try:
-            self.mqtt_client.publish(self.TOPIC_GATEWAY, payload=status, qos=0, retain=False)
-            
-        finally:
-            self.publish_lock.release()
+        self._publish(self.TOPIC_GATEWAY, status)
             
 
     def publish_gateway_coord(self):
         """
         Publish gateway location
         """
-        self.publish_lock.acquire()
-        try:
-            topic = self.TOPIC_GATEWAY + "/coord"
-            coordinates = str(self.coordinates[0]) + ", " + str(self.coordinates[1])
-            self.mqtt_client.publish(topic, payload=coordinates, qos=0, retain=False)
+        coordinates = str(self.coordinates[0]) + ", " + str(self.coordinates[1])
+        self._publish(self.TOPIC_GATEWAY + "/coord", coordinates)
             
-        finally:
-            self.publish_lock.release()
+            
+    def publish_gateway_report(self, name, report):
+        """
+        Publish gateway report
+        
+        @param name report name. Appended to the gateway topic
+        @param report report contents. Serialized as JSON
+        """
+        self._publish(self.TOPIC_GATEWAY + "/" + name, json.dumps(report))
             
             
+    def pending(self):
+        """
+        Get amount of uplink messages not yet handed over to the broker
+        
+        @return amount of messages
+        """
+        batched = 0
+        if self._publisher is not None:
+            batched = len(self._publisher.batch)
+        return self._outbox.qsize() + batched + max(0, self.inflight())
+
+
+    def spill(self):
+        """
+        Stop publishing and take every uplink message still waiting in the queue
+        or in the batch in progress
+        
+        @return list of (topic, payload, qos) tuples
+        """
+        messages = []
+        if self._publisher is not None:
+            self._publisher.stop()
+            messages = self._publisher.batch
+            self._publisher.batch = []
+        return messages + self._outbox.drain()
+
+
+    def requeue(self, messages):
+        """
+        Queue uplink messages for publication
+        
+        @param messages list of (topic, payload, qos) tuples
+        """
+        for message in messages:
+            self._outbox.put(message, Lane.LOW)
+
+
     def stop(self):
         """
         Stop MQTT client
         """
+        self.mqtt_client.disconnect()
         self.mqtt_client.loop_stop()
 
 
+    def reset_connection(self):
+        """
+        Break a connection that no longer makes progress. The socket is only
+        shut down, so the MQTT thread notices the broken connection by itself
+        and reconnects, as with any other connection loss
+        """
+        sock = self.mqtt_client.socket()
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+
+
+    def set_max_wait(self, max_wait):
+        """
+        Set maximum time low priority messages can be overtaken in the uplink queue
+        
+        @param max_wait maximum waiting time in seconds
+        """
+        self._outbox.max_wait = max_wait
+
+
     def set_rx_callback(self, funct):
         """
         Set callback reception function. Notify new MQTT reception
@@ -116,9 +342,21 @@ class MqttClient(object):
         @param funct: Definition of custom Callback function for the reception of packets
         """
         self._packet_received = funct
+
+
+    def set_control_callback(self, subtopic, funct):
+        """
+        Set callback function for a control subtopic. Messages published on this
+        subtopic are passed to the function instead of being sent to the modem
+        
+        @param subtopic control subtopic
+        @param funct custom callback function
+        """
+        self._control_handlers[subtopic] = funct
         
         
-    def __init__(self, mqtt_server, mqtt_port, mqtt_topic, user_key, gateway_key, coordinates):
+    def __init__(self, mqtt_server, mqtt_port, mqtt_topic, user_key, gateway_key, coordinates, protocol=3, client_id="", session_expiry=0, uplink_qos=0,
+                 compressor=None, batch_size=1, max_delay=1.0):
         """
         Constructor
         
@@ -128,10 +366,20 @@ class MqttClient(object):
         @param user_key User key
         @param gateway_key gateway key
         @param coordinates latitude,longitude
+        @param protocol MQTT version (3 for 3.1.1 or 5)
+        @param client_id MQTT client id. Required by persistent sessions
+        @param session_expiry MQTT 5 session expiry interval in seconds. 0 for clean sessions
+        @param uplink_qos quality of service of network messages
+        @param compressor UplinkCompressor object. Network messages are published one by one if None
+        @param batch_size maximum amount of network messages per compressed batch
+        @param max_delay maximum time a network message waits for its batch to be completed, in seconds
         """
         ## Callback
         self._packet_received = None
         
+        ## Callbacks per control subtopic
+        self._control_handlers = {}
+        
         ## MQTT server information
         self.mqtt_server = mqtt_server
         self.mqtt_port = mqtt_port
@@ -139,56 +387,164 @@ class MqttClient(object):
         ## Gateway coordinates
         self.coordinates = coordinates
         
+        ## Connection status
+        self.connected = False
+        ## Amount of messages passed to the MQTT client
+        self.publish_count = 0
+        ## Amount of messages handed over to the broker
+        self.sent_count = 0
+        ## Time stamp of the last message handed over to the broker
+        self.last_sent_time = time.time()
+        
+        ## MQTT protocol version
+        self.protocol = mqtt.MQTTv5 if protocol == 5 else mqtt.MQTTv311
+        ## Quality of service of network messages
+        self.uplink_qos = uplink_qos
+        ## Uplink batch compressor. None if disabled
+        self.compressor = compressor
+        ## Maximum amount of messages per batch
+        self.batch_size = batch_size
+        ## Maximum time to complete a batch
+        self.max_delay = max_delay
+        ## Maximum amount of topic aliases accepted by the broker
+        self.alias_maximum = 0
+        ## Maximum amount of messages in flight
+        self.window = MqttClient.DEFAULT_WINDOW
+        # Topic alias per topic
+        self._aliases = {}
+        
+        ## Radio frames handed over to paho
+        self.frames_published = 0
+        ## Radio frames sent (QoS 0) or acknowledged by the broker
+        self.frames_acked = 0
+        ## Radio frames lost along with a broken connection (QoS 0)
+        self.frames_lost = 0
+        ## Radio frames refused by paho
+        self.frames_failed = 0
+        # Radio frames per message id in flight
+        self._frames_inflight = {}
+        # Message ids completed before being noted
+        self._early_acks = set()
+        self._frames_lock = threading.Lock()
+        
         ## MQTT topics
         self.TOPIC_NETWORK = str(mqtt_topic + "/" + user_key + "/" + gateway_key + "/" + "network")
         self.TOPIC_CONTROL = str(mqtt_topic + "/" + user_key + "/" + gateway_key + "/" + "control")
         self.TOPIC_GATEWAY = str(mqtt_topic + "/" + user_key + "/" + gateway_key + "/" + "gateway")
+        self.TOPIC_BATCH = str(mqtt_topic + "/" + user_key + "/" + gateway_key + "/" + "batch")
         
         ## MQTT client
-        self.mqtt_client = mqtt.Client()
+        self.mqtt_client = mqtt.Client(client_id, protocol=self.protocol)
        
         # Assign MQTT callbacks
         self.mqtt_client.on_connect = self.on_connect
         self.mqtt_client.on_message = self.on_message
+        self.mqtt_client.on_disconnect = self.on_disconnect
+        self.mqtt_client.on_publish = self.on_publish
+        
+        self.publish_lock = threading.Lock()
+        
+        ## Uplink messages waiting to be published
+        self._outbox = LaneQueue(maxsize=MqttClient.OUTBOX_SIZE)
+        # Uplink publisher thread
+        self._publisher = None
         
         try:
-            # Connecto to MQTT broker
-            self.mqtt_client.connect(mqtt_server, mqtt_port, 60)
+            # Connect to MQTT broker from the MQTT thread. Uplinks are held
+            # in the outbox until the connection is completed
+            if self.protocol == mqtt.MQTTv5:
+                properties = Properties(PacketTypes.CONNECT)
+                properties.SessionExpiryInterval = session_expiry
+                self.mqtt_client.connect_async(mqtt_server, mqtt_port, 60, clean_start=(session_expiry == 0), properties=properties)
+            else:
+                self.mqtt_client.connect_async(mqtt_server, mqtt_port, 60)
             
             # Run MQTT thread
             self.mqtt_client.loop_start()
-    
-            self.publish_lock = threading.Lock()
             
-            # Heart beat transmission thread
-            hbeat_process = PeriodicHeartBeat(self.publish_gateway_status)
-            hbeat_process.start()
+            # Run uplink publisher
+            self._publisher = UplinkPublisher(self, self._outbox)
+            self._publisher.start()
             
         except Exception:
             print "Unable to connect to MQTT broker on address " + mqtt_server + "(port " + str(mqtt_port) + ")"
 
 
-class PeriodicHeartBeat(threading.Thread):
+class UplinkPublisher(threading.Thread):
     """
-    Periodic transmission of Lagarto server heart beat
+    Publish queued uplink messages while connected to the broker
     """
     def run(self):
         """
-        Start timer
+        Start publishing
         """
-        while True:
-            self.send_hbeat()
-            time.sleep(60.0)
-                      
-    def __init__(self, send_hbeat):
+        timer = get_startup_timer()
+        while self._go_on:
+            # Hold messages in the queue while disconnected or while the flow
+            # control window is full so that priorities still apply
+            if not self.client.connected or self.client.inflight() >= self.client.window:
+                time.sleep(0.01)
+                continue
+            message, lane = self.outbox.get_lane(0.5)
+            if message is None:
+                continue
+            if self.client.compressor is None:
+                topic, payload, qos = message
+                self.client._publish(topic, payload, qos, 1)
+            else:
+                self._publish_batch(message, lane)
+            if not timer.done:
+                timer.first_frame()
+
+
+    def _publish_batch(self, message, lane):
+        """
+        Complete batch of network messages from the same priority lane and
+        publish it compressed. The batch is published early when messages
+        from a higher lane are waiting. High priority messages do not wait
+        for the batch to be completed
+
+        @param message first message of the batch
+        @param lane priority lane of the message
+        """
+        self.batch.append(message)
+        max_delay = 0 if lane == Lane.HIGH else self.client.max_delay
+        self.batch.extend(self.outbox.get_batch(lane, self.client.batch_size - 1, max_delay))
+        if not self._go_on:
+            # Stopped while completing the batch. Taken over by MqttClient.spill
+            return
+
+        payload = self.client.compressor.compress([payload for topic, payload, qos in self.batch])
+        qos = max(qos for topic, payload, qos in self.batch)
+        self.client._publish(self.client.TOPIC_BATCH, payload, qos, len(self.batch))
+        self.batch = []
+
+
+    def stop(self):
+        """
+        Stop publishing. Returns once the message in progress is published or
+        the batch in progress is left unpublished
+        """
+        self._go_on = False
+        self.outbox.interrupt()
+        self.join(self.client.max_delay + 1.0)
+
+
+    def __init__(self, client, outbox):
         """
         Constructor
         
-        @param send_hbeat: Heart beat transmission method
+        @param client MqttClient object
+        @param outbox LaneQueue of (topic, payload, qos) messages
         """
-        threading.Thread.__init__(self)
+        threading.Thread.__init__(self, name="publisher")
         # Configure thread as daemon
         self.daemon = True
-        # Heart beat transmission method
-        self.send_hbeat = send_hbeat
-        
+        # MQTT client
+        self.client = client
+        # Uplink queue
+        self.outbox = outbox
+        ## Messages of the batch in progress
+        self.batch = []
+        # Publish until stopped
+        self._go_on = True
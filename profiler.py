@@ -0,0 +1,252 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+from stationlogger import get_logger
+import threading
+import time, sys, os
+
+# C libraries and types, loaded on first use. Looking libraries up may run
+# external commands, which is not worth doing on every start
+_loaded = False
+_libc = None
+_libpthread = None
+_ctypes = None
+_TimeSpec = None
+
+
+def _load_libraries():
+    """
+    Load C libraries needed to read thread CPU clocks
+
+    @return True if the libraries are available
+    """
+    global _loaded, _libc, _libpthread, _ctypes, _TimeSpec
+    if not _loaded:
+        _loaded = True
+        try:
+            import ctypes, ctypes.util
+
+            class TimeSpec(ctypes.Structure):
+                _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+            _libc = ctypes.CDLL(ctypes.util.find_library("c"))
+            _libpthread = ctypes.CDLL(ctypes.util.find_library("pthread"))
+            _TimeSpec = TimeSpec
+            _ctypes = ctypes
+        except (ImportError, OSError, TypeError):
+            _libc = None
+    return _libc is not None
+
+
+def thread_cpu_time(ident):
+    """
+    Get CPU time consumed by a thread (POSIX only)
+
+    @param ident thread identifier, as in threading.Thread.ident
+
+    @return CPU time in seconds or None if not available
+    """
+    if not _load_libraries():
+        return None
+    ctypes = _ctypes
+    clock = ctypes.c_int()
+    if _libpthread.pthread_getcpuclockid(ctypes.c_ulong(ident), ctypes.byref(clock)) != 0:
+        return None
+    timespec = _TimeSpec()
+    if _libc.clock_gettime(clock, ctypes.byref(timespec)) != 0:
+        return None
+    return timespec.tv_sec + timespec.tv_nsec * 1e-9
+
+
+class ProfileSampler(threading.Thread):
+    """
+    Sample the Python stacks of every thread during a given period
+    """
+    def run(self):
+        """
+        Take samples and write results to disk
+        """
+        own = threading.current_thread().ident
+        names = {}
+        cpu_start = {}
+        for thread in threading.enumerate():
+            names[thread.ident] = thread.name
+            cpu_start[thread.ident] = thread_cpu_time(thread.ident)
+
+        start = time.time()
+        samples = 0
+        while time.time() - start < self.duration:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(code.co_name + " (" + os.path.basename(code.co_filename) + ":" + str(code.co_firstlineno) + ")")
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread-" + str(ident)))
+                stack.reverse()
+                key = ";".join(stack)
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            samples += 1
+            time.sleep(self.interval)
+        elapsed = time.time() - start
+
+        # CPU breakdown per thread
+        for thread in threading.enumerate():
+            if cpu_start.get(thread.ident) is None:
+                continue
+            cpu_end = thread_cpu_time(thread.ident)
+            if cpu_end is not None:
+                self.cpu[thread.name] = round((cpu_end - cpu_start[thread.ident]) / elapsed, 4)
+
+        self._write()
+        self._logger.info("profile", "Profile with " + str(samples) + " samples written to " + self.filename)
+        self._logger.info("profile", "CPU per thread: " + str(self.cpu))
+        if self.finished is not None:
+            self.finished(self)
+
+
+    def _write(self):
+        """
+        Write stacks in folded format, one stack per line followed by its
+        amount of samples, ready to be used by flamegraph tools
+        """
+        try:
+            profile_file = open(self.filename, "w")
+            for stack, count in sorted(self.stacks.items()):
+                profile_file.write(stack + " " + str(count) + "\n")
+            profile_file.close()
+
+            cpu_file = open(self.filename + ".cpu", "w")
+            for name, usage in sorted(self.cpu.items()):
+                cpu_file.write(name + " " + str(usage) + "\n")
+            cpu_file.close()
+        except IOError as ex:
+            self._logger.error("profile", "Unable to write profile: " + str(ex))
+
+
+    def __init__(self, filename, duration, interval, finished=None):
+        """
+        Class constructor
+
+        @param filename path of the profile file
+        @param duration profiling period in seconds
+        @param interval sampling interval in seconds
+        @param finished function called once results are written
+        """
+        threading.Thread.__init__(self, name="profiler")
+        # Configure thread as daemon
+        self.daemon = True
+        ## Path of the profile file
+        self.filename = filename
+        ## Profiling period
+        self.duration = duration
+        ## Sampling interval
+        self.interval = interval
+        ## Callback function
+        self.finished = finished
+        ## Amount of samples per stack
+        self.stacks = {}
+        ## CPU usage (0-1) per thread name
+        self.cpu = {}
+        self._logger = get_logger()
+
+
+class Profiler:
+    """
+    On-demand sampling profiler. No thread runs while profiling is off
+    """
+    def start(self, duration=None):
+        """
+        Start profiling session
+
+        @param duration profiling period in seconds. Default period if None
+
+        @return True if a new session was started. False if a session is already running
+        """
+        self._lock.acquire()
+        try:
+            if self._sampler is not None:
+                return False
+            if duration is None:
+                duration = self.duration
+            duration = min(float(duration), self.max_duration)
+            filename = os.path.join(self.directory, "station-" + time.strftime("%Y%m%d-%H%M%S") + ".folded")
+            self._sampler = ProfileSampler(filename, duration, self.interval, self._finished)
+            self._sampler.start()
+            return True
+        finally:
+            self._lock.release()
+
+
+    def control_received(self, payload):
+        """
+        Profiling request received from the control topic
+
+        @param payload profiling period in seconds. Default period if empty
+        """
+        try:
+            duration = float(payload) if payload else None
+        except ValueError:
+            duration = None
+        self.start(duration)
+
+
+    def _finished(self, sampler):
+        """
+        Profiling session completed
+
+        @param sampler ProfileSampler object
+        """
+        self._lock.acquire()
+        self.last_cpu = sampler.cpu
+        self._sampler = None
+        self._lock.release()
+
+
+    def __init__(self, directory="/tmp", duration=30, interval=0.01, max_duration=300):
+        """
+        Class constructor
+
+        @param directory directory where profiles are written
+        @param duration default profiling period in seconds
+        @param interval sampling interval in seconds
+        @param max_duration maximum profiling period in seconds
+        """
+        ## Profiles directory
+        self.directory = directory
+        ## Default profiling period
+        self.duration = duration
+        ## Sampling interval
+        self.interval = interval
+        ## Maximum profiling period
+        self.max_duration = max_duration
+        ## CPU usage per thread measured in the last session
+        self.last_cpu = {}
+        # Running sampler
+        self._sampler = None
+        self._lock = threading.Lock()
@@ -0,0 +1,199 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+from stationlogger import get_logger
+from array import array
+import binascii
+import sys
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter per device address. State is kept in flat arrays
+    indexed through a dictionary of binary addresses so that tens of thousands
+    of devices only take a few bytes each
+    """
+    def allow(self, address):
+        """
+        Check whether a new frame from a given device can be forwarded
+
+        @param address device address in hex format
+
+        @return True if the frame can be forwarded. False if it has to be dropped
+        """
+        try:
+            key = binascii.unhexlify(address)
+        except (TypeError, binascii.Error):
+            key = address
+        now = time.time()
+
+        self._lock.acquire()
+        try:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._new_slot(key, now)
+
+            if self._quarantine[slot] > now:
+                accepted = False
+            else:
+                tokens = min(self.burst, self._tokens[slot] + (now - self._last[slot]) * self.rate)
+                accepted = tokens >= 1
+                if accepted:
+                    tokens -= 1
+                self._tokens[slot] = tokens
+            self._last[slot] = now
+
+            if not accepted:
+                self._dropped[slot] += 1
+                self.dropped += 1
+                if self._dropped[slot] >= self.quarantine_threshold and self._quarantine[slot] <= now:
+                    self._quarantine[slot] = now + self.quarantine_time
+                    self._logger.warning("ratelimit", "Device " + address + " quarantined for " + str(self.quarantine_time) + "s")
+            return accepted
+        finally:
+            self._lock.release()
+
+
+    def _new_slot(self, key, now):
+        """
+        Allocate slot for a new device, evicting the least recently seen
+        devices when the table is full
+
+        @param key binary device address
+        @param now current time
+
+        @return slot index
+        """
+        if len(self._slots) >= self.max_devices:
+            # Free 10% of the table at once. Least recently seen devices go first.
+            # Quarantined devices go last, those whose quarantine ends first, so
+            # that the table keeps its size when flooded
+            items = []
+            for dev, slot in self._slots.iteritems():
+                end = self._quarantine[slot]
+                if end > now:
+                    items.append((True, end, dev))
+                else:
+                    items.append((False, self._last[slot], dev))
+            items.sort()
+            for quarantined, time_stamp, dev in items[:max(1, self.max_devices / 10)]:
+                self._free.append(self._slots.pop(dev))
+
+        if len(self._free) > 0:
+            slot = self._free.pop()
+            self._tokens[slot] = self.burst
+            self._last[slot] = now
+            self._dropped[slot] = 0
+            self._quarantine[slot] = 0
+        else:
+            slot = len(self._tokens)
+            self._tokens.append(self.burst)
+            self._last.append(now)
+            self._dropped.append(0)
+            self._quarantine.append(0)
+        self._slots[key] = slot
+        return slot
+
+
+    def footprint(self):
+        """
+        Get memory taken by the per-device state
+
+        @return dictionary with the amount of devices tracked and their approximate size in bytes
+        """
+        self._lock.acquire()
+        try:
+            size = sys.getsizeof(self._slots) + sys.getsizeof(self._free)
+            size += sum(sys.getsizeof(key) for key in self._slots)
+            for state in (self._tokens, self._last, self._dropped, self._quarantine):
+                size += state.itemsize * len(state)
+            return {"items": len(self._slots), "bytes": size}
+        finally:
+            self._lock.release()
+
+
+    def report(self):
+        """
+        Get dropped frame counters and start a new reporting period
+
+        @return dictionary with the total amount of frames dropped, the amount of frames
+        dropped per device and the list of devices in quarantine. None if nothing was dropped
+        """
+        now = time.time()
+        self._lock.acquire()
+        try:
+            if self.dropped == 0:
+                return None
+            devices = {}
+            quarantined = []
+            for key, slot in self._slots.iteritems():
+                if self._dropped[slot] > 0:
+                    devices[binascii.hexlify(key).upper()] = self._dropped[slot]
+                    self._dropped[slot] = 0
+                if self._quarantine[slot] > now:
+                    quarantined.append(binascii.hexlify(key).upper())
+            report = {"dropped": self.dropped, "devices": devices, "quarantined": quarantined}
+            self.dropped = 0
+            return report
+        finally:
+            self._lock.release()
+
+
+    def __init__(self, rate=1.0, burst=10, quarantine_threshold=100, quarantine_time=600, max_devices=50000):
+        """
+        Class constructor
+
+        @param rate sustained amount of frames per second allowed per device
+        @param burst maximum amount of frames allowed in a burst
+        @param quarantine_threshold frames dropped within a reporting period before quarantining the device
+        @param quarantine_time quarantine period in seconds
+        @param max_devices maximum amount of devices tracked
+        """
+        ## Frames per second
+        self.rate = float(rate)
+        ## Bucket size
+        self.burst = float(burst)
+        ## Dropped frames before quarantine
+        self.quarantine_threshold = quarantine_threshold
+        ## Quarantine period
+        self.quarantine_time = quarantine_time
+        ## Maximum amount of devices
+        self.max_devices = max_devices
+        ## Frames dropped in the current reporting period
+        self.dropped = 0
+        # Slot per binary device address
+        self._slots = {}
+        # Released slots
+        self._free = []
+        # Per-slot state
+        self._tokens = array("f")
+        self._last = array("d")
+        self._dropped = array("L")
+        self._quarantine = array("d")
+        self._lock = threading.Lock()
+        self._logger = get_logger()
@@ -0,0 +1,112 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+"""
+Measure serial reception throughput with verbose logging off and on
+
+  python serialbench.py -n 20000 -o /var/log/station-bench.log
+
+Frames are written into a pseudo terminal (Linux) and read back by SerialPort
+through its usual reception path. Point the log file to the storage used by
+the gateway, such as its SD card, to include its write latency
+"""
+
+from serialport import SerialPort
+from stationlogger import get_logger
+from config import LogConfig
+import argparse
+import threading
+import time
+import os
+
+
+class PtyPort(SerialPort):
+    """
+    SerialPort on a pseudo terminal
+    """
+    def reset(self):
+        """
+        Pseudo terminals have no modem control lines
+        """
+        pass
+
+
+def run(frames, verbose):
+    """
+    Push frames through the reception path of a SerialPort
+
+    @param frames amount of frames
+    @param verbose log every frame received
+
+    @return tuple (elapsed time in seconds, frames received)
+    """
+    master, slave = os.openpty()
+    port = PtyPort(os.ttyname(slave), 38400, verbose)
+    received = [0]
+    done = threading.Event()
+
+    def frame_received(frame):
+        received[0] += 1
+        if received[0] == frames:
+            done.set()
+
+    port.set_rx_callback(frame_received)
+    port.start()
+    # Let the port flush its buffers before writing
+    time.sleep(0.1)
+
+    data = "".join("(%02X%02X)%024X%02X00%02X%02X%08X\r" % (0x30 + index % 64, 0x2A, index % 1000, index % 256,
+                                                           1 + index % 3, index % 16, index) for index in range(frames))
+    start = time.time()
+    offset = 0
+    while offset < len(data):
+        # The pseudo terminal buffers a few kB only
+        offset += os.write(master, data[offset:offset + 1024])
+    done.wait(60)
+    elapsed = time.time() - start
+
+    port.stop()
+    os.close(master)
+    os.close(slave)
+    return elapsed, received[0]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Serial reception throughput with verbose logging off and on")
+    parser.add_argument("-n", "--frames", type=int, default=20000, help="frames per run")
+    parser.add_argument("-o", "--output", default=os.devnull, help="log file written in verbose mode")
+    args = parser.parse_args()
+
+    logger = get_logger()
+    logger.configure(LogConfig({"file": args.output}))
+
+    print "%-8s %8s %10s %12s %8s" % ("verbose", "frames", "seconds", "frames/s", "dropped")
+    for verbose in (False, True):
+        dropped = logger.dropped
+        elapsed, received = run(args.frames, verbose)
+        logger.flush(5.0)
+        print "%-8s %8d %10.3f %12.0f %8d" % (verbose, received, elapsed, received / elapsed, logger.dropped - dropped)
@@ -25,7 +25,10 @@ __date__ ="Apr 22, 2016"
 #########################################################################
 
 import time
+import threading
 from serialport import SerialPort
+from stationlogger import get_logger
+from lanequeue import Lane
 from stationexception import StationException
 
 
@@ -50,6 +53,44 @@ class SerialModem:
             self._serport.stop()
 
 
+    def reopen(self):
+        """
+        Reopen serial port after its thread stopped, for instance because the
+        modem was unplugged, and restore the modem settings. Packets waiting for
+        transmission are kept
+        
+        @return True if the modem settings were restored
+        """
+        previous = self._serport
+        previous.stop()
+        serport = SerialPort(self.portname, self.portspeed, self._verbose)
+        serport.take_over(previous)
+        serport.set_rx_callback(self.serial_packet_received)
+        # The modem is reset along with the port
+        self._sermode = SerialModem.Mode.DATA
+        self._wait_modem_start = False
+        self._serport = serport
+        serport.start()
+
+        start = time.time()
+        while self._wait_modem_start == False:
+            if time.time() - start > 10:
+                raise StationException("Serial modem on " + self.portname + " not ready")
+            time.sleep(0.01)
+
+        # Settings changed at run time may have been lost with the reset
+        return self.reconfigure(self.freq_channel, self.syncword, self.devaddress) is not None
+
+
+    def get_serial_port(self):
+        """
+        Get serial port object
+        
+        @return SerialPort object
+        """
+        return self._serport
+
+
     def serial_packet_received(self, buf):
         """
         Serial packet received. This is a callback function called from
@@ -59,17 +100,37 @@ class SerialModem:
         """        
         # If modem in command mode
         if self._sermode == SerialModem.Mode.COMMAND:
-            self._atresponse = buf
-            self.__atresponse_received = True
+            # Radio frames keep arriving while in command mode
+            if buf[:1] == "(":
+                self._frame_received(buf)
+            else:
+                self.modem_lines += 1
+                self._atresponse = buf
+                self.__atresponse_received = True
         # If modem in data mode
         else:
             # Waiting for ready signal from modem?
             if self._wait_modem_start == False:
+                self.modem_lines += 1
                 if buf == "Modem ready!":
                     self._wait_modem_start = True
-            # Pass serial packet to parent class
-            elif self._packet_received is not None:
-                self._packet_received(buf)
+            else:
+                self._frame_received(buf)
+
+
+    def _frame_received(self, buf):
+        """
+        Pass radio frame to parent class
+        
+        @param buf: Frame received in String format
+        """
+        if self._packet_received is None:
+            self.frames_unhandled += 1
+            return
+        # Drop line noise, partial frames and modem messages
+        if self._validator is None or self._validator.validate(buf):
+            self.frames_validated += 1
+            self._packet_received(buf)
 
 
     def set_rx_callback(self, funct):
@@ -81,6 +142,16 @@ class SerialModem:
         self._packet_received = funct
         
 
+    def set_frame_validator(self, validator):
+        """
+        Set validator for incoming frames. Invalid frames are not passed to the
+        reception callback
+        
+        @param validator FrameValidator object
+        """
+        self._validator = validator
+
+
     def enter_command_mode(self):
         """
         Enter command mode (for AT commands)
@@ -157,48 +228,96 @@ class SerialModem:
         if self._serport is None:
             raise StationException("Port " + self.portname + " is not open")
 
-        # Skip wireless packets
-        self._atresponse = "("
-        # Send serial packet
-        self._serport.send(cmd)
+        self._atresponse = ""
+        # Send command ahead of any queued packet. Radio frames received in
+        # the meantime are not taken as responses
+        self._serport.send_command(cmd)
         
         # Wait for response from modem
-        while len(self._atresponse) == 0 or self._atresponse[0] == '(':
-            if not self._wait_for_response(timeout):
-                return None
+        if not self._wait_for_response(timeout):
+            return None
         # Return response received from gateway
         return self._atresponse
 
 
-    def send(self, packet):
+    def send(self, packet, lane=Lane.NORMAL, key=None):
         """
         Send packet to serial modem
         
         @param packet: packet to be transmitted
+        @param lane: priority lane
+        @param key: coalescing key. A packet still waiting with the same key is replaced
         """
-        self._serport.send(packet + "\r")
+        self._serport.send(packet + "\r", lane, key)
 
    
+    def reconfigure(self, channel=None, syncword=None, address=None):
+        """
+        Change several modem settings in a single command mode session. Packet
+        transmissions are held meanwhile and radio frames received in command
+        mode are still passed to the reception callback
+        
+        @param channel: New frequency channel. Unchanged if None
+        @param syncword: New synchronization word. Unchanged if None
+        @param address: New device address. Unchanged if None
+        
+        @return Time in seconds packet transmissions were held. None if any setting failed
+        """
+        # Check format
+        commands = []
+        if channel is not None:
+            if channel < 0 or channel > 0xFF:
+                raise StationException("Frequency channels must be 1-byte length")
+            commands.append(("ATCH=" + "{0:02X}".format(channel) + "\r", "freq_channel", channel))
+        if syncword is not None:
+            if syncword < 0 or syncword > 0xFFFF:
+                raise StationException("Synchronization words must be 2-byte length")
+            commands.append(("ATSW=" + "{0:04X}".format(syncword) + "\r", "syncword", syncword))
+        if address is not None:
+            if address < 0 or address > 0xFF:
+                raise StationException("Device addresses must be 1-byte length")
+            commands.append(("ATDA=" + "{0:02X}".format(address) + "\r", "devaddress", address))
+        if len(commands) == 0:
+            return 0.0
+
+        self._reconfig_lock.acquire()
+        self._serport.hold()
+        start = time.time()
+        try:
+            success = self.enter_command_mode()
+            if success:
+                # Run AT commands
+                for command, attribute, value in commands:
+                    response = self.run_at_command(command)
+                    if response is None or response[0:2] != "OK":
+                        success = False
+                        break
+                    setattr(self, attribute, value)
+            # Back to data mode in any case
+            if not self.enter_data_mode():
+                success = False
+        finally:
+            self._serport.release()
+            gap = time.time() - start
+            self._reconfig_lock.release()
+
+        self.last_gap = gap
+        status = "completed" if success else "failed"
+        self._logger.info("reconfigure", "Reconfiguration " + status + ". Transmissions held for " + str(int(gap * 1000)) + " ms", self.portname)
+        if not success:
+            return None
+        return gap
+
+
     def set_freq_channel(self, value):
         """
         Set frequency channel for the wireless gateway
         
         @param value: New frequency channel
+        
+        @return True in case of success
         """
-        # Check format
-        if value > 0xFF:
-            raise StationException("Frequency channels must be 1-byte length")
-        # Switch to command mode if necessary
-        if self._sermode == SerialModem.Mode.DATA:
-            self.enter_command_mode()
-        # Run AT command
-        response =  self.run_at_command("ATCH=" + "{0:02X}".format(value) + "\r")
-        if response is None:
-            return False
-        if response[0:2] == "OK":
-            self.freq_channel = value
-            return True
-        return False
+        return self.reconfigure(channel=value) is not None
 
 
     def set_sync_word(self, value):
@@ -206,22 +325,10 @@ class SerialModem:
         Set synchronization word for the wireless gateway
         
         @param value: New synchronization word
+        
+        @return True in case of success
         """
-        # Check format
-        if value > 0xFFFF:
-            raise StationException("Synchronization words must be 2-byte length")
-        # Switch to command mode if necessary
-        if self._sermode == SerialModem.Mode.DATA:
-            self.enter_command_mode()
-        # Run AT command
-        response = self.runAtCommand("ATSW=" + "{0:04X}".format(value) + "\r")
-        if response is None:
-            return False
-        if response[0:2] == "OK":
-            self.syncword = value
-            return True
-        else:
-            return False
+        return self.reconfigure(syncword=value) is not None
 
 
     def set_device_address(self, value):
@@ -229,22 +336,11 @@ class SerialModem:
         Set device address for the serial gateway
         
         @param value: New device address
+        
+        @return True in case of success
         """
-        # Check format
-        if value > 0xFF:
-            raise StationException("Device addresses must be 1-byte length")
-        # Switch to command mode if necessary
-        if self._sermode == SerialModem.Mode.DATA:
-            self.enter_command_mode()
-        # Run AT command
-        response = self.run_at_command("ATDA=" + "{0:02X}".format(value) + "\r")
-        if response is None:
-            return False
-        if response[0:2] == "OK":
-            self.devaddress = value
-            return True
-        else:
-            return False
+        return self.reconfigure(address=value) is not None
+
     
     def _wait_for_response(self, millis):
         """
@@ -277,14 +373,29 @@ class SerialModem:
         self.__atresponse_received = None
         # "Packet received" callback function. To be defined by the parent object
         self._packet_received = None
+        # Validator of incoming frames
+        self._validator = None
         ## Name(path) of the serial port
         self.portname = portname
         ## Speed of the serial port in bps
         self.portspeed = speed
+        # Verbose network traffic
+        self._verbose = verbose
         ## Hardware version of the serial modem
         self.hwversion = None
         ## Firmware version of the serial modem
         self.fwversion = None
+        ## Data frames accepted by the validator
+        self.frames_validated = 0
+        ## Modem messages and AT responses received, not radio frames
+        self.modem_lines = 0
+        ## Data frames received before any reception callback was set
+        self.frames_unhandled = 0
+        ## Time packet transmissions were held during the last reconfiguration
+        self.last_gap = None
+        # Only one reconfiguration at a time
+        self._reconfig_lock = threading.Lock()
+        self._logger = get_logger()
 
         try:
             # Open serial port
@@ -305,6 +416,7 @@ class SerialModem:
                     soft_reset = True
                 elif soft_reset and elapsed > 10:
                     raise StationException("Unable to reset serial modem")
+                time.sleep(0.01)
 
             # Retrieve modem settings
             # Switch to command mode
@@ -25,11 +25,13 @@ __date__ ="Apr 23, 2016"
 #########################################################################
 
 from stationexception import StationException
+from stationlogger import get_logger
+from lanequeue import LaneQueue, Lane
 
 import threading
+import collections
 import serial
 import time, sys
-import Queue
 
 
 class SerialPort(threading.Thread):
@@ -53,6 +55,8 @@ class SerialPort(threading.Thread):
                 serbuf = []
                 # Listen for incoming serial data
                 while self._go_on:
+                    # Progress counter checked by the watchdog
+                    self.loop_count += 1
                     try:
                         # Read single byte (non blocking function)
                         ch = self._serport.read()
@@ -61,17 +65,25 @@ class SerialPort(threading.Thread):
                             if ch == '\r' or ((ch == '(') and (len(serbuf) > 0)):
                                 strBuf = "".join(serbuf)
                                 serbuf = []
+                                self.last_rx_time = time.time()
+                                # Sequence number of the frame being handled
+                                self.rx_sequence += 1
         
                                 # Enable for debug only
                                 if self._verbose == True:
-                                    print "Rved: " + strBuf
+                                    self._logger.debug("rx", strBuf, self.portname, "<")
                                 
                                 # Notify reception
                                 if self.serial_received is not None:
                                     try:
                                         self.serial_received(strBuf)
                                     except StationException as ex:
+                                        self.callback_errors += 1
                                         ex.display()
+                                    except Exception as ex:
+                                        # Only this frame is lost. Keep listening
+                                        self.callback_errors += 1
+                                        self._logger.error("rx", "Frame " + str(self.rx_sequence) + " lost: " + repr(ex), self.portname)
                             elif ch != '\n':
                                 # Append char at the end of the buffer (list)
                                 serbuf.append(ch)
@@ -84,22 +96,27 @@ class SerialPort(threading.Thread):
            
                     # Anything to be sent?                   
                     #self._send_lock.acquire()
-                    if not self._strtosend.empty():
+                    # Modem commands go first and are not affected by hold()
+                    if len(self._commands) > 0 or (not self.held and not self._strtosend.empty()):
                         if time.time() - self.last_transmission_time > SerialPort.txdelay:
-                            strpacket = self._strtosend.get()          
-                            # Send serial packet
-                            self._serport.write(strpacket) 
-                            # Update time stamp
-                            self.last_transmission_time = time.time()                       
-                            # Enable for debug only
-                            if self._verbose == True:
-                                print "Sent: " + strpacket
+                            if len(self._commands) > 0:
+                                strpacket = self._commands.popleft()
+                            else:
+                                strpacket = self._strtosend.get(0)
+                            if strpacket is not None:
+                                # Send serial packet
+                                self._serport.write(strpacket) 
+                                # Update time stamp
+                                self.last_transmission_time = time.time()                       
+                                # Enable for debug only
+                                if self._verbose == True:
+                                    self._logger.debug("tx", strpacket, self.portname, ">")
                     #self._send_lock.release()
             else:
                 raise StationException("Unable to read serial port " + self.portname + " since it is not open")
         else:
             raise StationException("Unable to read serial port " + self.portname + " since it is not open")
-        print "Closing serial port..."
+        self._logger.info("serial", "Closing serial port", self.portname)
 
     
     def stop(self):
@@ -107,6 +124,9 @@ class SerialPort(threading.Thread):
         Stop serial port
         """
         self._go_on = False
+        # Let the listening loop finish before closing the port
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(1.0)
         if self._serport is not None:
             if self._serport.isOpen():
                 self._serport.flushInput()
@@ -114,17 +134,125 @@ class SerialPort(threading.Thread):
                 self._serport.close()
                 
 
-    def send(self, buf):
+    def send(self, buf, lane=Lane.NORMAL, key=None):
         """
         Send string buffer via serial
         
         @param buf: Packet to be transmitted
+        @param lane: Priority lane
+        @param key: Coalescing key. A packet still waiting with the same key is replaced
         """
         #self._send_lock.acquire()
-        self._strtosend.put(buf)
+        self._strtosend.put(buf, lane, key)
         #self._send_lock.release()
 
 
+    def send_command(self, buf):
+        """
+        Send modem command via serial, ahead of any packet and even while
+        packets are held
+        
+        @param buf: Command to be transmitted
+        """
+        self._commands.append(buf)
+
+
+    def hold(self):
+        """
+        Hold packet transmissions. Packets keep being queued
+        """
+        self.held = True
+
+
+    def release(self):
+        """
+        Resume packet transmissions
+        """
+        self.held = False
+
+
+    def pending(self):
+        """
+        Get amount of packets waiting for transmission
+        
+        @return amount of packets
+        """
+        return self._strtosend.qsize()
+
+
+    def spill(self):
+        """
+        Take every packet still waiting for transmission
+        
+        @return list of packets
+        """
+        return self._strtosend.drain()
+
+
+    def take_over(self, previous):
+        """
+        Take over packets waiting for transmission and counters from a previous
+        SerialPort object on the same device
+        
+        @param previous: SerialPort object no longer running
+        """
+        self._strtosend = previous._strtosend
+        self.rx_sequence = previous.rx_sequence
+        self.callback_errors = previous.callback_errors
+
+
+    def txqueue_age(self):
+        """
+        Get age of the oldest packet waiting for transmission
+        
+        @return age in seconds. 0 if the transmission queue is empty
+        """
+        return self._strtosend.oldest_age()
+
+
+    def set_max_wait(self, max_wait):
+        """
+        Set maximum time low priority packets can be overtaken in the transmission queue
+        
+        @param max_wait: Maximum waiting time in seconds
+        """
+        self._strtosend.max_wait = max_wait
+
+
+    def coalesced(self):
+        """
+        Get amount of packets replaced in the transmission queue by newer ones
+        
+        @return amount of packets saved since start
+        """
+        return self._strtosend.coalesced
+
+
+    def txqueue_footprint(self):
+        """
+        Get memory taken by the transmission queue
+        
+        @return dictionary with the amount of packets and bytes. See LaneQueue.footprint
+        """
+        return self._strtosend.footprint()
+
+
+    def txqueue_report(self):
+        """
+        Get latency stats per priority lane of the transmission queue
+        
+        @return dictionary of lanes. See LaneQueue.report
+        """
+        return self._strtosend.report()
+
+
+    def cancel_write(self):
+        """
+        Abort a blocking write in progress. Requires pyserial 3.1 or later
+        """
+        self._serport.cancel_write()
+
+
     def set_rx_callback(self, cb_function):
         """
         Set callback reception function. This function is called whenever a new serial packet
@@ -158,7 +286,7 @@ class SerialPort(threading.Thread):
         @param speed: Serial baudrate in bps
         @param verbose: Print out GWAP traffic (True or False)
         """
-        threading.Thread.__init__(self)
+        threading.Thread.__init__(self, name="serial " + portname)
         ## Name(path) of the serial port
         self.portname = portname
         ## Speed of the serial port in bps
@@ -168,12 +296,27 @@ class SerialPort(threading.Thread):
         ## Callback Rx function
         self.serial_received = None
         # Strint to be sent
-        self._strtosend = Queue.Queue()
+        self._strtosend = LaneQueue()
         #self._send_lock = threading.Lock()
         # Verbose network traffic
         self._verbose = verbose
+        # Asynchronous logger
+        self._logger = get_logger()
         # Time stamp of the last transmission
         self.last_transmission_time = 0
+        ## Amount of iterations of the listening loop
+        self.loop_count = 0
+        ## Time stamp of the last serial packet received
+        self.last_rx_time = time.time()
+        ## Sequence number of the last frame received. Reception callbacks run on
+        ## this thread, so it identifies the frame being handled
+        self.rx_sequence = 0
+        ## Frames lost because of an exception in the reception callback
+        self.callback_errors = 0
+        ## True while packet transmissions are held
+        self.held = False
+        # Modem commands waiting for transmission
+        self._commands = collections.deque()
         
         try:
             # Open serial port in blocking mode
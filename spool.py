@@ -0,0 +1,83 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+from stationexception import StationException
+import json
+import os
+
+
+class Spool:
+    """
+    On-disk spool of uplink messages that could not be published before
+    shutting down. Messages are stored as JSON lines and replayed on start
+    """
+    def write(self, messages):
+        """
+        Append messages to the spool
+
+        @param messages list of (topic, payload, qos) tuples
+        """
+        try:
+            spool_file = open(self.filename, "a")
+            for topic, payload, qos in messages:
+                spool_file.write(json.dumps({"topic": topic, "payload": payload, "qos": qos}) + "\n")
+            spool_file.close()
+        except IOError as ex:
+            raise StationException("Unable to write spool " + self.filename + ": " + str(ex))
+
+
+    def read(self):
+        """
+        Read and empty the spool
+
+        @return list of (topic, payload, qos) tuples
+        """
+        messages = []
+        if not os.path.exists(self.filename):
+            return messages
+        try:
+            spool_file = open(self.filename)
+            for line in spool_file:
+                try:
+                    message = json.loads(line)
+                    messages.append((str(message["topic"]), str(message["payload"]), message["qos"]))
+                except (ValueError, KeyError):
+                    pass
+            spool_file.close()
+            os.remove(self.filename)
+        except (IOError, OSError) as ex:
+            raise StationException("Unable to read spool " + self.filename + ": " + str(ex))
+        return messages
+
+
+    def __init__(self, filename):
+        """
+        Class constructor
+
+        @param filename path of the spool file
+        """
+        ## Spool file
+        self.filename = filename
@@ -0,0 +1,107 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+from stationlogger import get_logger
+import threading
+import time
+
+
+class StartupTimer:
+    """
+    Record the end of every startup phase, from process start to the first
+    frame forwarded to the broker
+    """
+    def mark(self, phase):
+        """
+        Record end of a startup phase. Safe to be called from any thread
+
+        @param phase phase name
+        """
+        if not self.done:
+            self._lock.acquire()
+            self.phases.append((phase, time.time()))
+            self._lock.release()
+
+
+    def first_frame(self):
+        """
+        First frame forwarded. Close startup measurement and report it
+        """
+        if self.done:
+            return
+        self.mark("first frame forwarded")
+        self.done = True
+        total = self.phases[-1][1] - self.start
+
+        logger = get_logger()
+        if self.instrument:
+            previous = self.start
+            for phase, end in self.phases:
+                logger.info("startup", "%-40s %8.1f ms" % (phase, (end - previous) * 1000))
+                previous = end
+            logger.info("startup", "%-40s %8.1f ms" % ("total", total * 1000))
+        if self.budget is not None and total > self.budget:
+            logger.warning("startup", "Startup took %.1f s, over the %.1f s budget" % (total, self.budget))
+
+
+    def configure(self, startup_config):
+        """
+        Apply startup settings
+
+        @param startup_config StartupConfig object
+        """
+        self.instrument = startup_config.instrument
+        self.budget = startup_config.budget
+
+
+    def __init__(self):
+        """
+        Class constructor
+        """
+        ## Start of the measurement
+        self.start = time.time()
+        ## List of (phase, end time)
+        self.phases = []
+        ## True once the first frame has been forwarded
+        self.done = False
+        ## Log duration of every phase
+        self.instrument = False
+        ## Maximum time from start to first frame forwarded, in seconds
+        self.budget = None
+        self._lock = threading.Lock()
+
+
+# Global timer, started as soon as this module is imported
+_timer = StartupTimer()
+
+
+def get_startup_timer():
+    """
+    Get global startup timer
+
+    @return StartupTimer object
+    """
+    return _timer
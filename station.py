@@ -24,10 +24,18 @@ __author__="Daniel Berenguer"
 __date__  ="Apr 24, 2016"
 #########################################################################
 
+# Imported first so that startup time is measured from here
+from startuptimer import get_startup_timer
 from config import Config
 from modemmanager import ModemManager
+from channelplanner import ChannelPlanner
+from profiler import Profiler
+from memoryprofiler import MemoryProfiler
+from spool import Spool
 from stationexception import StationException
+from stationlogger import get_logger
 import signal
+import time
 import os
 import sys
 
@@ -48,39 +56,203 @@ class Station():
         ## List of serial modems
         self.modem_managers = []
         
+        ## RF channel planner
+        self.planner = None
+        
+        ## On-demand profiler
+        self.profiler = None
+        
+        ## Memory accounting
+        self.memory = None
+        
+        ## Shutdown settings
+        self.shutdown = None
+        ## Spool of unpublished uplinks
+        self.spool = None
+        # True once stop() has been called
+        self._stopping = False
+        
         ## Config file
         try:
             cfg_location = os.path.join(os.path.dirname(sys.argv[0]), Station.CONFIG_FILE)
             config = Config(cfg_location)
             
+            # Logging settings
+            get_logger().configure(config.log)
+            
+            # Startup measurement
+            timer = get_startup_timer()
+            timer.configure(config.startup)
+            timer.mark("imports and config")
+            
+            # Shutdown and spool
+            self.shutdown = config.shutdown
+            if self.shutdown.spool is not None:
+                self.spool = Spool(self.shutdown.spool)
+            
+            # Profiler
+            prof = config.profiling
+            self.profiler = Profiler(prof.directory, prof.duration, prof.interval, prof.max_duration)
+            
+            # Memory accounting
+            mem = config.memory
+            self.memory = MemoryProfiler(self.publish_memory_report, mem.period, mem.top, mem.rss_budget, mem.trace_frames)
+            self.memory.register("logger", get_logger().footprint)
+            
+            # RF channel plan
+            if config.channel_plan is not None:
+                plan = config.channel_plan
+                self.planner = ChannelPlanner(plan.channels, plan.bitrate, plan.period, plan.max_devices)
+                self.memory.register("planner", self.planner.footprint)
+            
             # for each serial port
             for port_config in config.serial_ports:
                 # Create and start serial modem
-                modem_manager = ModemManager(port_config.name, port_config.speed, True, config.mqtt_server, config.mqtt_port, config.mqtt_topic, config.user_key, config.gateway_key, config.coordinates)
+                modem_manager = ModemManager(port_config.name, port_config.speed, config.log.verbose, config.mqtt_server, config.mqtt_port, config.mqtt_topic, config.user_key, config.gateway_key, config.coordinates, self.planner, config.watchdog, config.rate_limit, config.priority,
+                                             config.mqtt_version, config.mqtt_session_expiry, config.mqtt_qos, config.downlink,
+                                             config.validation, config.coalesce, config.compression,
+                                             config.link_quality, config.mqtt_sequence)
                 # Append modem to list
                 self.modem_managers.append(modem_manager)
+                # Profiling requests from the control topic
+                if hasattr(modem_manager, "mqtt_client"):
+                    modem_manager.mqtt_client.set_control_callback("profile", self.profiler.control_received)
+                    # Memory reports from the control topic
+                    modem_manager.mqtt_client.set_control_callback("memory", self.memory.control_received)
+                    self.memory.register(port_config.name, modem_manager.footprint)
+                
+            # Control requests changing channels or addresses must name the port
+            for modem_manager in self.modem_managers:
+                modem_manager.modems = len(self.modem_managers)
+                
+            # Move modems to their channels
+            if self.planner is not None:
+                self.planner.assign(self.modem_managers)
+                self.planner.start()
+                timer.mark("channel plan")
+            
+            # Memory reports, on request and periodic
+            self.memory.start()
+                
+            # Publish uplinks spooled on last shutdown
+            if self.spool is not None:
+                messages = self.spool.read()
+                for modem_manager in self.modem_managers:
+                    if len(messages) == 0:
+                        break
+                    if hasattr(modem_manager, "mqtt_client"):
+                        modem_manager.mqtt_client.requeue(messages)
+                        get_logger().info("shutdown", str(len(messages)) + " spooled uplinks queued")
+                        break
                 
         except StationException:
             raise
 
 
-def signal_handler(signal, frame):
+    def publish_memory_report(self, report):
+        """
+        Publish memory report on the gateway topic
+        
+        @param report memory report. See MemoryProfiler.snapshot
+        """
+        for modem_manager in self.modem_managers:
+            if hasattr(modem_manager, "mqtt_client"):
+                modem_manager.mqtt_client.publish_gateway_report("memory", report)
+                break
+
+
+    def stop(self):
+        """
+        Orderly shutdown. Stop accepting new input, drain transmission and
+        publication queues until the deadline, spool or drop what is left,
+        publish final gateway status and close ports and broker connections
+        """
+        if self._stopping:
+            return
+        self._stopping = True
+        logger = get_logger()
+        managers = [manager for manager in self.modem_managers if hasattr(manager, "mqtt_client")]
+
+        for manager in managers:
+            manager.stop_input()
+
+        # Drain queues
+        deadline = 5.0 if self.shutdown is None else self.shutdown.deadline
+        pending = sum(manager.pending() for manager in managers)
+        end = time.time() + deadline
+        while time.time() < end and sum(manager.pending() for manager in managers) > 0:
+            time.sleep(0.05)
+
+        # Whatever is left is spooled (uplinks) or dropped
+        spooled = 0
+        dropped = 0
+        for manager in managers:
+            # Publisher stopped first, so that nothing moves from its batch to paho afterwards
+            uplinks = manager.mqtt_client.spill()
+            dropped += len(manager.modem.get_serial_port().spill())
+            dropped += max(0, manager.mqtt_client.inflight())
+            if self.spool is not None and len(uplinks) > 0:
+                try:
+                    self.spool.write(uplinks)
+                    spooled += len(uplinks)
+                    continue
+                except StationException as ex:
+                    ex.show()
+            dropped += len(uplinks)
+
+        for manager in managers:
+            manager.close("STOPPED")
+
+        flushed = max(0, pending - spooled - dropped)
+        logger.info("shutdown", "Flushed " + str(flushed) + ", spooled " + str(spooled) + ", dropped " + str(dropped) +
+                    " packets. " + str(sum(manager.refused for manager in managers)) + " packets refused while draining")
+        logger.flush()
+
+
+def signal_handler(signum, frame):
     """
     Handle signal received
     """
+    if station is not None:
+        station.stop()
     sys.exit(0)
 
 
+def profile_signal_handler(signum, frame):
+    """
+    Handle profiling signal (SIGUSR1)
+    """
+    if station is not None and station.profiler is not None:
+        station.profiler.start()
+
+
+def memory_signal_handler(signum, frame):
+    """
+    Handle memory report signal (SIGUSR2)
+    """
+    if station is not None and station.memory is not None:
+        station.memory.request()
+
+
 if __name__ == '__main__':
    
-    # Catch possible SIGINT signals
+    # Catch possible SIGINT and SIGTERM signals
     signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    # Start profiling session on SIGUSR1
+    signal.signal(signal.SIGUSR1, profile_signal_handler)
+    # Publish memory report on SIGUSR2
+    signal.signal(signal.SIGUSR2, memory_signal_handler)
 
+    station = None
     try:      
         # SWAP manager
         station = Station()     
     except StationException as ex:
         ex.display()
 
-    signal.pause()
+    # Profiling and memory signals wake the main thread up too. Only the
+    # SIGINT/SIGTERM handler leaves this loop
+    while True:
+        signal.pause()
 
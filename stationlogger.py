@@ -0,0 +1,284 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+import threading
+import collections
+import time, sys
+
+
+class LogLevel:
+    """
+    Log levels
+    """
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    ERROR = 40
+
+    names = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+
+class LogFilter:
+    """
+    Per-category sampling and rate limit
+
+    @param sample only one out of every 'sample' records is accepted
+    @param rate maximum amount of records per second (None for no limit)
+    """
+    def accept(self):
+        """
+        Check whether a new record can be queued
+
+        @return True if the record passes the filter
+        """
+        self._count += 1
+        if self._count < self.sample:
+            return False
+        self._count = 0
+
+        if self.rate is not None:
+            now = time.time()
+            self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+
+        return True
+
+
+    def __init__(self, sample=1, rate=None):
+        self.sample = max(1, sample)
+        self.rate = rate
+        # Sampling counter
+        self._count = 0
+        # Token bucket
+        self._tokens = rate or 0
+        self._last = time.time()
+
+
+class StationLogger(threading.Thread):
+    """
+    Asynchronous logger. Calling threads only append a record to a deque,
+    which is lock-free in CPython. Records are formatted and written from
+    a background thread so that a slow output never blocks the caller
+    """
+    ## Maximum amount of records waiting to be written
+    maxqueue = 10000
+    ## Polling period of the writer thread (in seconds)
+    period = 0.05
+
+
+    def run(self):
+        """
+        Drain queued records into the output stream
+        """
+        while True:
+            written = 0
+            try:
+                while True:
+                    self._write(self._records.popleft())
+                    written += 1
+            except IndexError:
+                pass
+            if written > 0:
+                try:
+                    self._stream.flush()
+                except IOError:
+                    pass
+            else:
+                time.sleep(StationLogger.period)
+
+
+    def _write(self, record):
+        """
+        Format and write single record
+
+        @param record tuple (timestamp, level, category, port, direction, text)
+        """
+        timestamp, level, category, port, direction, text = record
+        # Date and time are only formatted once per second
+        second = int(timestamp)
+        if second != self._second:
+            self._second = second
+            self._prefix = time.strftime("%d-%m-%Y %H:%M:%S", time.localtime(second))
+        line = self._prefix + ".%03d" % int((timestamp - second) * 1000)
+        line += " " + LogLevel.names.get(level, str(level)) + " " + category
+        if port is not None:
+            line += " " + port
+        if direction is not None:
+            line += " " + direction
+        try:
+            self._stream.write(line + " " + str(text) + "\n")
+        except IOError:
+            self.dropped += 1
+
+
+    def log(self, level, category, text, port=None, direction=None):
+        """
+        Queue log record. Safe to be called from any thread
+
+        @param level log level
+        @param category record category (rx, tx, mqtt, ...)
+        @param text log message
+        @param port serial port related to the record
+        @param direction traffic direction ("<" for reception, ">" for transmission)
+        """
+        if level < self.level:
+            return
+        record_filter = self._filters.get(category)
+        if record_filter is not None and not record_filter.accept():
+            self.filtered += 1
+            return
+        if len(self._records) >= StationLogger.maxqueue:
+            self.dropped += 1
+        self._records.append((time.time(), level, category, port, direction, text))
+
+
+    def debug(self, category, text, port=None, direction=None):
+        """
+        Queue DEBUG record
+        """
+        self.log(LogLevel.DEBUG, category, text, port, direction)
+
+
+    def info(self, category, text, port=None, direction=None):
+        """
+        Queue INFO record
+        """
+        self.log(LogLevel.INFO, category, text, port, direction)
+
+
+    def warning(self, category, text, port=None, direction=None):
+        """
+        Queue WARNING record
+        """
+        self.log(LogLevel.WARNING, category, text, port, direction)
+
+
+    def error(self, category, text, port=None, direction=None):
+        """
+        Queue ERROR record
+        """
+        self.log(LogLevel.ERROR, category, text, port, direction)
+
+
+    def footprint(self):
+        """
+        Get memory taken by the records waiting to be written
+
+        @return dictionary with the amount of records queued and their approximate size in bytes
+        """
+        records = list(self._records)
+        size = sys.getsizeof(self._records) + sum(sys.getsizeof(record) + sys.getsizeof(record[5]) for record in records)
+        return {"items": len(records), "bytes": size}
+
+
+    def flush(self, timeout=1.0):
+        """
+        Wait for queued records to be written
+
+        @param timeout maximum waiting time in seconds
+        """
+        end = time.time() + timeout
+        while len(self._records) > 0 and time.time() < end:
+            time.sleep(0.01)
+        # Give the writer thread time to complete the last write
+        time.sleep(StationLogger.period)
+
+
+    def set_filter(self, category, sample=1, rate=None):
+        """
+        Set sampling and rate limit for a given category
+
+        @param category record category
+        @param sample only one out of every 'sample' records is accepted
+        @param rate maximum amount of records per second
+        """
+        self._filters[category] = LogFilter(sample, rate)
+
+
+    def configure(self, log_config):
+        """
+        Apply logging settings
+
+        @param log_config LogConfig object
+        """
+        self.level = log_config.level
+        if log_config.filename is not None:
+            self._stream = open(log_config.filename, "a")
+        for category, settings in log_config.filters.items():
+            self.set_filter(category, settings.get("sample", 1), settings.get("rate"))
+
+
+    def __init__(self, stream=None):
+        """
+        Class constructor
+
+        @param stream output stream. Standard output by default
+        """
+        threading.Thread.__init__(self, name="logger")
+        # Configure thread as daemon
+        self.daemon = True
+        ## Minimum level to be logged
+        self.level = LogLevel.DEBUG
+        ## Records discarded because of a full queue or a write error
+        self.dropped = 0
+        ## Records discarded by sampling or rate limits
+        self.filtered = 0
+        # Output stream
+        self._stream = stream or sys.stdout
+        # Pending records. Oldest records are discarded when full
+        self._records = collections.deque(maxlen=StationLogger.maxqueue)
+        # Filters per category
+        self._filters = {}
+        # Second of the last record written and its formatted date and time
+        self._second = None
+        self._prefix = ""
+
+
+# Global logger
+_logger = None
+_logger_lock = threading.Lock()
+
+
+def get_logger():
+    """
+    Get global logger, creating and starting it on first use
+
+    @return StationLogger object
+    """
+    global _logger
+    if _logger is None:
+        _logger_lock.acquire()
+        try:
+            if _logger is None:
+                logger = StationLogger()
+                logger.start()
+                _logger = logger
+        finally:
+            _logger_lock.release()
+    return _logger
@@ -0,0 +1,135 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+from stationexception import StationException
+import struct
+import zlib
+
+
+class UplinkCompressor:
+    """
+    Compress batches of uplink messages with a preset dictionary.
+
+    Every compressed batch starts with a one byte format version and the
+    32-bit identifier (CRC32) of the dictionary, 0 if none, followed by a
+    raw deflate stream of the messages separated by new lines. The stream
+    can be inflated with the dictionary as zlib preset dictionary (zdict).
+    zlib in Python 2 can not take preset dictionaries, so the compressor is
+    primed once by compressing the dictionary itself and then copied for
+    every batch
+    """
+    ## Format version
+    VERSION = 1
+    ## Maximum dictionary size, the deflate window
+    MAX_DICTIONARY = 32768
+
+
+    def compress(self, messages):
+        """
+        Compress batch of messages
+
+        @param messages list of message strings
+
+        @return compressed batch
+        """
+        compressor = self._primed.copy()
+        return self._header + compressor.compress("\n".join(messages)) + compressor.flush()
+
+
+    @staticmethod
+    def decompress(batch, dictionaries={}):
+        """
+        Decompress batch of messages
+
+        @param batch compressed batch
+        @param dictionaries dictionary contents per identifier
+
+        @return list of message strings
+        """
+        version, dictionary_id = struct.unpack(">BI", batch[:5])
+        if version != UplinkCompressor.VERSION:
+            raise StationException("Unknown compression format " + str(version))
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        if dictionary_id != 0:
+            dictionary = dictionaries.get(dictionary_id)
+            if dictionary is None:
+                raise StationException("Unknown compression dictionary %08X" % dictionary_id)
+            # Fill the window with the dictionary
+            primer = zlib.compressobj(1, zlib.DEFLATED, -zlib.MAX_WBITS)
+            decompressor.decompress(primer.compress(dictionary) + primer.flush(zlib.Z_SYNC_FLUSH))
+        return decompressor.decompress(batch[5:]).split("\n")
+
+
+    @staticmethod
+    def dictionary_id(dictionary):
+        """
+        Get identifier of a dictionary
+
+        @param dictionary dictionary contents
+
+        @return 32-bit identifier
+        """
+        return zlib.crc32(dictionary) & 0xFFFFFFFF
+
+
+    @staticmethod
+    def load(filename):
+        """
+        Read dictionary file
+
+        @param filename path to the dictionary
+
+        @return dictionary contents
+        """
+        try:
+            dictionary_file = open(filename, "rb")
+            dictionary = dictionary_file.read()
+            dictionary_file.close()
+        except IOError as ex:
+            raise StationException("Unable to read compression dictionary " + filename + ": " + str(ex))
+        if len(dictionary) > UplinkCompressor.MAX_DICTIONARY:
+            raise StationException("Compression dictionary " + filename + " is longer than " + str(UplinkCompressor.MAX_DICTIONARY) + " bytes")
+        return dictionary
+
+
+    def __init__(self, dictionary=None, level=9):
+        """
+        Class constructor
+
+        @param dictionary dictionary contents. No dictionary if None
+        @param level compression level (1-9)
+        """
+        ## Dictionary identifier. 0 if no dictionary
+        self.dictionary_id = 0
+        # Raw deflate compressor with the dictionary in its window
+        self._primed = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        if dictionary:
+            self.dictionary_id = UplinkCompressor.dictionary_id(dictionary)
+            # The output is only needed by the decompressor, which builds it by itself
+            self._primed.compress(dictionary)
+            self._primed.flush(zlib.Z_SYNC_FLUSH)
+        # Version and dictionary identifier
+        self._header = struct.pack(">BI", UplinkCompressor.VERSION, self.dictionary_id)
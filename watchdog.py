@@ -0,0 +1,197 @@
+#########################################################################
+#
+# Copyright (c) 2026 LIBERiot station contributors
+#
+# This file is part of the lagarto project.
+#
+# lagarto  is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# lagarto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with lagarto; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+#########################################################################
+__author__="LIBERiot station contributors"
+__date__  ="Oct 19, 2026"
+#########################################################################
+
+from stationexception import StationException
+from stationlogger import get_logger
+import threading
+import time
+
+
+class Health:
+    """
+    Health levels, from best to worst
+    """
+    RUNNING = 0
+    DEGRADED = 1
+    STALLED = 2
+
+    names = {RUNNING: "RUNNING", DEGRADED: "DEGRADED", STALLED: "STALLED"}
+
+
+class Watchdog(threading.Thread):
+    """
+    Supervise serial and MQTT threads of a modem manager and publish the
+    resulting health status as gateway heart beat
+    """
+    def run(self):
+        """
+        Run periodic checks
+        """
+        last_hbeat = 0
+        while self._go_on:
+            time.sleep(self.config.period)
+            if not self._go_on:
+                break
+            previous = self.health
+            self.check()
+            now = time.time()
+            if self.health != previous or now - last_hbeat >= self.config.heartbeat:
+                self.send_hbeat(self.status)
+                last_hbeat = now
+            if self.config.selfheal and self.health != Health.RUNNING:
+                self.heal()
+
+
+    def check(self):
+        """
+        Evaluate health of the modem manager
+
+        @return status string. Health level and serial port, followed by the list of reasons
+        unless RUNNING
+        """
+        now = time.time()
+        health = Health.RUNNING
+        reasons = []
+        self.serial_stalled = False
+        self.mqtt_stalled = False
+
+        serport = self.modem.get_serial_port()
+        if not serport.is_alive():
+            health = Health.STALLED
+            reasons.append("serial thread dead")
+        else:
+            # Serial loop progress
+            if serport.loop_count != self._loop_count:
+                self._loop_count = serport.loop_count
+                self._loop_time = now
+            elif now - self._loop_time > self.config.loopstall:
+                health = Health.STALLED
+                self.serial_stalled = True
+                reasons.append("serial loop stalled for %.1fs" % (now - self._loop_time))
+
+            # Transmission latency
+            age = serport.txqueue_age()
+            if age > self.config.txqueueage and not serport.held:
+                health = max(health, Health.DEGRADED)
+                reasons.append("tx queue age %.1fs" % age)
+
+            # Reception
+            silence = now - serport.last_rx_time
+            if silence > self.config.rxsilence:
+                health = max(health, Health.DEGRADED)
+                reasons.append("no serial packet for %ds" % silence)
+
+        # MQTT
+        if not self.mqtt_client.connected:
+            health = max(health, Health.DEGRADED)
+            reasons.append("mqtt disconnected")
+        elif self.mqtt_client.publish_count > self.mqtt_client.sent_count + 1:
+            idle = now - self.mqtt_client.last_sent_time
+            if idle > self.config.publishstall:
+                health = Health.STALLED
+                self.mqtt_stalled = True
+                reasons.append("mqtt publishing stalled for %ds" % idle)
+
+        self.health = health
+        # Modems share the gateway topic, so every status carries its port
+        self.status = Health.names[health] + " " + self.modem.portname
+        if health != Health.RUNNING:
+            self.status += " (" + "; ".join(reasons) + ")"
+        return self.status
+
+
+    def stop(self):
+        """
+        Stop supervision
+        """
+        self._go_on = False
+
+
+    def heal(self):
+        """
+        Try to recover from a stall
+        """
+        # Lost connections are recovered by the MQTT thread itself. Connections
+        # that look alive but make no progress are broken so that it reconnects
+        if self.mqtt_stalled:
+            self._logger.warning("watchdog", "Resetting MQTT connection", self.modem.portname)
+            try:
+                self.mqtt_client.reset_connection()
+            except Exception as ex:
+                self._logger.error("watchdog", "Unable to reset connection: " + str(ex), self.modem.portname)
+
+        serport = self.modem.get_serial_port()
+        if self.serial_stalled:
+            # Abort blocking write, if supported by pyserial
+            self._logger.warning("watchdog", "Cancelling pending serial write", serport.portname)
+            try:
+                serport.cancel_write()
+            except Exception as ex:
+                self._logger.error("watchdog", "Unable to cancel write: " + str(ex), serport.portname)
+        elif not serport.is_alive():
+            # Only this modem is affected. Retried on every check until the port is back
+            self._logger.error("watchdog", "Serial thread is dead. Reopening serial port", serport.portname)
+            try:
+                if self.modem.reopen():
+                    self._logger.info("watchdog", "Serial port reopened", serport.portname)
+                else:
+                    self._logger.error("watchdog", "Serial port reopened but modem settings could not be restored", serport.portname)
+            except StationException as ex:
+                self._logger.error("watchdog", "Unable to reopen serial port: " + ex.description, serport.portname)
+
+
+    def __init__(self, modem, mqtt_client, send_hbeat, config):
+        """
+        Constructor
+
+        @param modem SerialModem object
+        @param mqtt_client MqttClient object
+        @param send_hbeat heart beat transmission method. Takes the status string as argument
+        @param config WatchdogConfig object
+        """
+        threading.Thread.__init__(self, name="watchdog " + modem.portname)
+        # Configure thread as daemon
+        self.daemon = True
+        ## Serial modem
+        self.modem = modem
+        ## MQTT client
+        self.mqtt_client = mqtt_client
+        ## Heart beat transmission method
+        self.send_hbeat = send_hbeat
+        ## Thresholds
+        self.config = config
+        ## Health level
+        self.health = Health.RUNNING
+        ## Status string
+        self.status = Health.names[Health.RUNNING] + " " + modem.portname
+        ## Stall flags
+        self.serial_stalled = False
+        self.mqtt_stalled = False
+        # Last progress seen on the serial loop
+        self._loop_count = None
+        self._loop_time = time.time()
+        self._go_on = True
+        self._logger = get_logger()